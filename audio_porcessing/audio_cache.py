@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+from pydub import AudioSegment
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+module_logger = logging.getLogger(__name__)
+
+_CACHED_FILE = re.compile(r'[0-9a-f]{64}\.wav')
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive lock shared by every process using the same lock file, held for the duration of the block."""
+    with open(path, 'a+b') as file:
+        if os.name == 'nt':
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+class TierStats:
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
+
+
+class AudioCache:
+    """
+    Synthesised audio keyed by a hash of its text, in two tiers.
+
+    Decoded audio of hot responses stays in memory, least recently used first out once it holds more than
+    max_memory_bytes of PCM. Every response is also kept as a WAV file in the cache directory, which is bounded by
+    max_disk_bytes the same way. Sizes and last use of the files are tracked in an index file, which is only read
+    and written under a lock file, so several bot processes can share one directory. Files are written under a
+    temporary name and renamed into place, a reader never sees a partial WAV.
+
+    Lookups don't read the index: a memory hit touches no file and a disk hit just opens the WAV. Their last use is
+    kept in memory and written to the index with the next add, or by the first lookup flush_seconds after the last
+    write, so eviction order lags behind by at most that much.
+    """
+
+    INDEX_FILE = 'index.json'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, directory: str, max_disk_bytes: int = 512 * 2 ** 20, max_memory_bytes: int = 64 * 2 ** 20,
+                 flush_seconds: float = 30.0):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.flush_seconds = flush_seconds
+        self.memory_stats = TierStats()
+        self.disk_stats = TierStats()
+        self._memory: OrderedDict[str, AudioSegment] = OrderedDict()
+        self._memory_bytes = 0
+        # key -> last use not written to the index yet
+        self._used: Dict[str, float] = {}
+        self._flushed = time.monotonic()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.wav')
+
+    def get(self, key: str) -> Optional[AudioSegment]:
+        with self._lock:
+            sound = self._memory.get(key)
+            if sound is not None:
+                self._memory.move_to_end(key)
+                self.memory_stats.hits += 1
+                self._used[key] = time.time()
+            else:
+                self.memory_stats.misses += 1
+
+        if sound is None:
+            sound = self._read(key)
+            if sound is None:
+                self.disk_stats.misses += 1
+                return None
+            self.disk_stats.hits += 1
+            with self._lock:
+                self._used[key] = time.time()
+            self._remember(key, sound)
+        if time.monotonic() - self._flushed >= self.flush_seconds:
+            self.flush()
+        return sound
+
+    def get_or_create(self, key: str, synthesise: Callable[[str], None]) -> AudioSegment:
+        """Cached audio of key, otherwise synthesise writes it to the file path it is given and it gets cached."""
+        sound = self.get(key)
+        if sound is not None:
+            return sound
+
+        sound = self._store(key, synthesise, decode=True)
+        self._remember(key, sound)
+        return sound
+
+    def add(self, key: str, synthesise: Callable[[str], None]):
+        """Synthesise key onto disk only, without decoding it."""
+        self._store(key, synthesise, decode=False)
+
+    def flush(self):
+        """Write the last use of keys looked up since the previous write to the index."""
+        with self._lock:
+            self._flushed = time.monotonic()
+            if not self._used:
+                return
+        with self._locked_index() as index:
+            self._apply_used(index)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key in self._memory:
+                return True
+        with self._locked_index() as index:
+            return key in index and os.path.isfile(self.path(key))
+
+    def missing(self, keys: Iterable[str]) -> List[str]:
+        """Keys which aren't cached, in order, reading the index once for all of them."""
+        with self._lock:
+            keys = [key for key in keys if key not in self._memory]
+        with self._locked_index() as index:
+            files = set(os.listdir(self.directory))
+            return [key for key in keys if key not in index or f'{key}.wav' not in files]
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {'memory': self.memory_stats.as_dict(), 'disk': self.disk_stats.as_dict()}
+
+    def _read(self, key: str) -> Optional[AudioSegment]:
+        """Decoded file of key, None if there is none (any more), e.g. evicted by another process."""
+        try:
+            with open(self.path(key), 'rb') as file:
+                return AudioSegment.from_file(file, format='wav')
+        except FileNotFoundError:
+            return None
+
+    def _store(self, key: str, synthesise: Callable[[str], None], decode: bool) -> Optional[AudioSegment]:
+        module_logger.info(f"GENERATING: {key}")
+        temporary = os.path.join(self.directory, f'{key}.{os.getpid()}.{threading.get_ident()}.tmp.wav')
+        try:
+            synthesise(temporary)
+            size = os.path.getsize(temporary)
+            # Decoded before it is published, once renamed it may be evicted at any time.
+            sound = AudioSegment.from_file(temporary, format='wav') if decode else None
+            with self._locked_index() as index:
+                os.replace(temporary, self.path(key))
+                index[key] = [size, time.time()]
+                self._apply_used(index)
+                self._evict(index)
+            return sound
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def _apply_used(self, index: Dict[str, list]):
+        with self._lock:
+            used, self._used = self._used, {}
+            self._flushed = time.monotonic()
+        for key, last_use in used.items():
+            if key in index:
+                index[key][1] = max(index[key][1], last_use)
+
+    def _remember(self, key: str, sound: AudioSegment):
+        size = len(sound.raw_data)
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = sound
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted.raw_data)
+
+    def _evict(self, index: Dict[str, list]):
+        total = sum(size for size, _ in index.values())
+        for key in sorted(index, key=lambda name: index[name][1]):
+            if total <= self.max_disk_bytes:
+                break
+            total -= index.pop(key)[0]
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            module_logger.debug(f"Evicted {key} from the audio cache")
+
+    @contextmanager
+    def _locked_index(self):
+        index_path = os.path.join(self.directory, self.INDEX_FILE)
+        with file_lock(os.path.join(self.directory, self.LOCK_FILE)):
+            if os.path.isfile(index_path):
+                with open(index_path) as file:
+                    index = json.load(file)
+            else:
+                index = self._adopt_files()
+            before = json.dumps(index)
+            yield index
+            if json.dumps(index) != before:
+                with open(f'{index_path}.tmp', 'w') as file:
+                    json.dump(index, file)
+                os.replace(f'{index_path}.tmp', index_path)
+
+    def _adopt_files(self) -> Dict[str, list]:
+        """Index of a directory without one yet, e.g. filled by an older version which never deleted anything."""
+        index = {}
+        for name in os.listdir(self.directory):
+            if _CACHED_FILE.fullmatch(name):
+                stat = os.stat(os.path.join(self.directory, name))
+                index[name[:-len('.wav')]] = [stat.st_size, stat.st_mtime]
+        self._evict(index)
+        return index
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from audio_porcessing.resampling import StreamingResampler
+from audio_porcessing.speech_to_text import BLOCKS_PER_SECOND, RATE_PROCESS, VoiceSegmenter
+from core.logic import CoreBot
+
+module_logger = logging.getLogger(__name__)
+
+FRAME_SAMPLES = RATE_PROCESS // BLOCKS_PER_SECOND
+
+
+def wav_frames(path: str) -> Iterator[bytes]:
+    """
+    16-bit mono RATE_PROCESS frames of a 16-bit PCM WAV file, as fast as they can be read rather than at the pace
+    of a live stream. The file is memory mapped and read in blocks of 20ms, other rates are resampled and channels
+    averaged block by block, so memory use doesn't grow with the length of the file.
+    """
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with wave.open(mapped) as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError(f"{path}: only 16-bit PCM is supported")
+            channels, rate = wav.getnchannels(), wav.getframerate()
+            resampler = StreamingResampler(rate, RATE_PROCESS) if rate != RATE_PROCESS else None
+            block = max(1, rate // 50)
+            pending = np.empty(0, dtype=np.int16)
+            while True:
+                data = wav.readframes(block)
+                if not data:
+                    break
+                samples = np.frombuffer(data, dtype=np.int16)
+                if channels > 1:
+                    samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+                if resampler is not None:
+                    samples = resampler.process(samples.tobytes())
+                pending = np.concatenate((pending, samples))
+                whole = len(pending) - len(pending) % FRAME_SAMPLES
+                for start in range(0, whole, FRAME_SAMPLES):
+                    yield pending[start:start + FRAME_SAMPLES].tobytes()
+                pending = pending[whole:]
+
+
+# Per worker process, loaded once by _load_worker.
+_model: Any = None
+_segmenter: Optional[VoiceSegmenter] = None
+
+
+def _load_worker(model: str, scorer: Optional[str], aggressiveness: int):
+    global _model, _segmenter
+    import stt
+
+    _model = stt.Model(model)
+    if scorer:
+        _model.enableExternalScorer(scorer)
+    _segmenter = VoiceSegmenter(aggressiveness)
+
+
+def transcribe(path: str) -> Dict[str, Any]:
+    """Utterances of one file with their start and end in seconds, in a worker process."""
+    consumed = 0
+
+    def counted() -> Iterator[bytes]:
+        nonlocal consumed
+        for frame in wav_frames(path):
+            consumed += 1
+            yield frame
+
+    utterances = []
+    stream_context, fed = _model.createStream(), 0
+    for frame in itertools.chain(_segmenter.vad_collector(counted()), [None]):
+        if frame is not None:
+            stream_context.feedAudioContent(np.frombuffer(frame, np.int16))
+            fed += 1
+            continue
+        if fed == 0:
+            continue
+        # The collector stops without a closing None at the end of a file, the appended one finishes the last.
+        text = stream_context.finishStream()
+        if text != "":
+            utterances.append({'start': (consumed - fed) / BLOCKS_PER_SECOND, 'end': consumed / BLOCKS_PER_SECOND,
+                               'transcript': text})
+        stream_context, fed = _model.createStream(), 0
+    return {'file': path, 'duration': consumed / BLOCKS_PER_SECOND, 'utterances': utterances}
+
+
+class BatchTranscriber:
+    """
+    Transcribes recorded WAV files on a pool of worker processes, each loading the STT model once, and optionally
+    replays the transcripts to a CoreBot, every file as its own conversation. One JSON line is written per
+    utterance; real_time_factor is the wall time spent per second of audio of the last run.
+    """
+
+    def __init__(self, model: str, scorer: str = None, processes: int = None, aggressiveness: int = 3):
+        self.model = model
+        self.scorer = scorer
+        self.processes = processes if processes is not None else os.cpu_count()
+        self.aggressiveness = aggressiveness
+        self.audio_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    @property
+    def real_time_factor(self) -> float:
+        return self.wall_seconds / self.audio_seconds if self.audio_seconds else 0.0
+
+    def run(self, paths: List[str], output_path: str, bot: CoreBot = None) -> float:
+        """Transcribe paths in order into output_path, returns the real-time factor."""
+        start = time.perf_counter()
+        self.audio_seconds = 0.0
+        with ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_load_worker,
+                                 initargs=(self.model, self.scorer, self.aggressiveness)) as pool, \
+                open(output_path, 'w', encoding='utf-8') as output:
+            for result in pool.map(transcribe, paths):
+                self.audio_seconds += result['duration']
+                for utterance in result['utterances']:
+                    record = {'file': result['file'], **utterance}
+                    if bot is not None:
+                        response = bot.ask(utterance['transcript'], session_id=result['file'])
+                        record['response'] = response.response_text if response is not None else None
+                        record['confidence'] = response.confidence if response is not None else None
+                    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                module_logger.info(f"Transcribed {result['file']}: {len(result['utterances'])} utterances")
+
+        self.wall_seconds = time.perf_counter() - start
+        module_logger.info(f"{self.audio_seconds:.1f}s of audio in {self.wall_seconds:.1f}s, "
+                           f"real-time factor {self.real_time_factor:.3f}")
+        return self.real_time_factor
+
+
+def wav_paths(directory: str) -> List[str]:
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(directory)
+                  for name in names if name.lower().endswith('.wav'))
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from pydub import AudioSegment
+from pydub.playback import play
+
+module_logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r'(?<=[.?!])\s+')
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in (part.strip() for part in _SENTENCE_END.split(text)) if sentence]
+
+
+class AudioSink:
+    """
+    Plays segments back to back through one output stream kept open between them, so consecutive sentences play
+    without the gap of opening a new stream each. write blocks only until the segment is buffered by PyAudio.
+    Without PyAudio installed every segment is played on its own through pydub.
+    """
+
+    def __init__(self) -> None:
+        self._audio = None
+        self._stream = None
+        self._format: Optional[Tuple[int, int, int]] = None
+
+    def write(self, segment: AudioSegment):
+        try:
+            import pyaudio
+        except ImportError:
+            play(segment)
+            return
+
+        audio_format = (segment.sample_width, segment.channels, segment.frame_rate)
+        if self._stream is None or audio_format != self._format:
+            self.close()
+            self._audio = pyaudio.PyAudio()
+            self._stream = self._audio.open(format=self._audio.get_format_from_width(segment.sample_width),
+                                            channels=segment.channels, rate=segment.frame_rate, output=True)
+            self._format = audio_format
+        self._stream.write(segment.raw_data)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._audio.terminate()
+        self._audio = self._stream = self._format = None
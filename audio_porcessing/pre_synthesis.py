@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from audio_porcessing.audio_cache import AudioCache
+
+module_logger = logging.getLogger(__name__)
+
+# Progress callback, called with the number of finished texts, their total and the text just finished.
+Progress = Callable[[int, int, str], None]
+
+# Per worker process, loaded once by _load_worker.
+_tts: Any = None
+_cache: Optional[AudioCache] = None
+
+
+def _load_worker(model_name: str, cache_path: str, max_disk_bytes: int):
+    global _tts, _cache
+    import torch
+    from TTS.api import TTS
+    # Parallelism comes from the processes, intra-op threads would only oversubscribe the cores.
+    torch.set_num_threads(1)
+    _tts = TTS(model_name)
+    _cache = AudioCache(cache_path, max_disk_bytes=max_disk_bytes, max_memory_bytes=0)
+
+
+def _synthesise(text: str, key: str) -> Tuple[str, int]:
+    if key not in _cache:
+        _cache.add(key, lambda file_path: _tts.tts_to_file(text=text, file_path=file_path))
+    return text, _file_size(_cache.path(key))
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def log_progress(done: int, total: int, text: str):
+    module_logger.info(f"Pre-synthesised {done}/{total}: {text[:32]}")
+
+
+class PreSynthesis:
+    """
+    Synthesises texts into an audio cache on a pool of worker processes, each loading the TTS model once.
+    Runs in the calling thread, or with background=True in a daemon thread while the bot already serves; texts
+    answered before their turn are synthesised by the stream itself as usual, whichever finishes first wins.
+    Texts already cached are skipped when the run starts, from then on total counts only the others.
+
+    Texts are synthesised in the order given, so the most needed come first, e.g. CoreBot.static_responses(). The
+    cache evicts its least recently used files beyond max_disk_bytes, which would be the first texts synthesised,
+    so no text is submitted once the files of the texts, those cached already included, and an estimate of those
+    being synthesised would exceed it; the texts left are counted in skipped.
+    """
+
+    def __init__(self, items: List[Tuple[str, str]], model_name: str, cache: AudioCache,
+                 processes: int = None, progress: Progress = log_progress) -> None:
+        # (cleaned text, cache key) pairs, those already cached are dropped by _run
+        self.items = list(dict(items).items())
+        self.model_name = model_name
+        self.cache = cache
+        self.processes = processes if processes is not None else max(1, (os.cpu_count() or 1) - 1)
+        self.progress = progress
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        # Bytes of the files of the texts, cached before the run or synthesised by it.
+        self.disk_bytes = 0
+        self._finished = threading.Event()
+
+    @property
+    def total(self) -> int:
+        return len(self.items)
+
+    def run(self, background: bool = False) -> PreSynthesis:
+        if background:
+            threading.Thread(target=self._run, name='pre-synthesis', daemon=True).start()
+        else:
+            self._run()
+        return self
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def _run(self):
+        try:
+            missing = set(self.cache.missing(key for _, key in self.items))
+            self.disk_bytes = sum(_file_size(self.cache.path(key)) for _, key in self.items if key not in missing)
+            self.items = [(text, key) for text, key in self.items if key in missing]
+            if not self.items:
+                return
+            module_logger.info(f"Pre-synthesising {self.total} responses on {self.processes} processes")
+            # Spawned, forking a process which may already hold a loaded model and threads isn't safe.
+            with ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_load_worker,
+                                     initargs=(self.model_name, self.cache.directory, self.cache.max_disk_bytes)) as pool:
+                self._synthesise_within_budget(pool)
+        finally:
+            self._finished.set()
+
+    def _synthesise_within_budget(self, pool: ProcessPoolExecutor):
+        """
+        Keeps two texts per process submitted while the budget allows. Until a text is finished there is no
+        estimate, so only one per process is submitted; then texts are estimated at the bytes per character of
+        those finished so far.
+        """
+        pending: Dict[Future, str] = {}
+        position, characters, synthesised = 0, 0, 0
+        while position < len(self.items) or pending:
+            while position < len(self.items) and len(pending) < self.processes * (2 if characters else 1):
+                text, key = self.items[position]
+                in_flight = sum(map(len, pending.values())) + len(text)
+                estimate = synthesised / characters * in_flight if characters else 0
+                if self.disk_bytes + estimate >= self.cache.max_disk_bytes:
+                    break
+                pending[pool.submit(_synthesise, text, key)] = text
+                position += 1
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                try:
+                    text, size = future.result()
+                except Exception:
+                    self.failed += 1
+                    module_logger.exception("Pre-synthesis failed")
+                    continue
+                self.done += 1
+                self.disk_bytes += size
+                characters += len(text)
+                synthesised += size
+                self.progress(self.done, self.total, text)
+        self.skipped = len(self.items) - position
+        if self.skipped:
+            module_logger.warning(f"Pre-synthesis stopped at {self.disk_bytes} of max_disk_bytes "
+                                  f"{self.cache.max_disk_bytes}, {self.skipped} responses left unsynthesised")
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from math import gcd
+from typing import Dict, Tuple
+
+import numpy as np
+from scipy import signal
+
+
+class StreamingResampler:
+    """
+    Resamples a stream of 16-bit mono blocks by the rational ratio output_rate / input_rate with a polyphase
+    low-pass FIR filter, as scipy.signal.resample_poly would do over the whole stream.
+
+    The last taps_per_phase - 1 input samples and the phase of the next output are carried from block to block,
+    so the output has no discontinuities at block boundaries. Input is read through a frombuffer view into a
+    preallocated work buffer, and the gather indices of a block layout are computed once and reused, the phase
+    pattern of a fixed block size repeats.
+    """
+
+    def __init__(self, input_rate: int, output_rate: int, taps_per_phase: int = 24, max_block: int = 4096):
+        divisor = gcd(input_rate, output_rate)
+        self.up = output_rate // divisor
+        self.down = input_rate // divisor
+        self.taps_per_phase = taps_per_phase
+
+        # An odd length, zero padded to whole phases, delays the output by a whole number of upsampled samples.
+        length = taps_per_phase * self.up - (taps_per_phase * self.up + 1) % 2
+        taps = np.zeros(taps_per_phase * self.up)
+        taps[:length] = signal.firwin(length, 1.0 / max(self.up, self.down), window=('kaiser', 5.0)) * self.up
+        delay = (length - 1) // 2
+        # Output samples lagging behind the input, starting off the delay's phase makes it a whole number.
+        self.delay = delay // self.down
+        # polyphase[p, k] weighs the input k samples before the one an output of phase p is aligned to
+        self.polyphase = taps.reshape(taps_per_phase, self.up).T.astype(np.float32)
+
+        self._history = taps_per_phase - 1
+        self._work = np.zeros(self._history + max_block, dtype=np.float32)
+        self._output = np.empty(max_block * self.up // self.down + 2, dtype=np.int16)
+        # upsampled position of the next output, relative to the first sample of the next block
+        self._position = self._start = delay % self.down
+        self._layouts: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def process(self, data: bytes) -> np.ndarray:
+        """Resampled int16 samples of the block, a view valid until the next call."""
+        block = np.frombuffer(data, dtype=np.int16)
+        length = len(block)
+        if self._history + length > len(self._work):
+            self._grow(length)
+
+        work = self._work
+        work[self._history:self._history + length] = block
+        count = max(0, -(-(length * self.up - self._position) // self.down))
+        indices, coefficients = self._layout(self._position, count)
+
+        output = self._output[:count]
+        values = np.einsum('ij,ij->i', work[indices], coefficients)
+        np.rint(values, out=values)
+        np.clip(values, -32768, 32767, out=values)
+        output[:] = values
+
+        self._position += count * self.down - length * self.up
+        # Keep the tail as the history of the next block.
+        work[:self._history] = work[length:length + self._history]
+        return output
+
+    def resample(self, data: bytes) -> bytes:
+        return self.process(data).tobytes()
+
+    def reset(self):
+        self._work[:self._history] = 0
+        self._position = self._start
+
+    def _layout(self, position: int, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        key = (position, count)
+        layout = self._layouts.get(key)
+        if layout is None:
+            upsampled = position + np.arange(count) * self.down
+            base = upsampled // self.up + self._history
+            indices = base[:, None] - np.arange(self.taps_per_phase)[None, :]
+            layout = self._layouts[key] = (indices, self.polyphase[upsampled % self.up])
+            if len(self._layouts) > 64:
+                self._layouts.pop(next(iter(self._layouts)))
+        return layout
+
+    def _grow(self, length: int):
+        work = np.zeros(self._history + length, dtype=np.float32)
+        work[:self._history] = self._work[:self._history]
+        self._work = work
+        self._output = np.empty(length * self.up // self.down + 2, dtype=np.int16)
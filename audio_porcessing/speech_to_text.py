@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import collections
+import logging
+import queue
+import wave
+from typing import Callable, Dict, Iterator, Optional
+
+import numpy as np
+
+from audio_porcessing.resampling import StreamingResampler
+
+module_logger = logging.getLogger(__name__)
+
+# Network/VAD rate-space
+RATE_PROCESS = 16000
+BLOCKS_PER_SECOND = 50
+
+
+class AudioCapture:
+    """
+    Streams raw audio from the microphone, or a WAV file at its pace, through one input stream kept open for its
+    whole life. Frames are received on PyAudio's thread into a bounded buffer, so capture goes on while the reader
+    is busy answering. When the reader falls more than max_buffered_seconds behind, the oldest frames are dropped
+    and counted in frames_dropped.
+    """
+
+    CHANNELS = 1
+
+    def __init__(self, device: int = None, input_rate: int = RATE_PROCESS, file: str = None,
+                 max_buffered_seconds: float = 30.0):
+        import pyaudio
+
+        self.device = device
+        self.input_rate = input_rate
+        self.sample_rate = RATE_PROCESS
+        self.block_size = int(RATE_PROCESS / float(BLOCKS_PER_SECOND))
+        self.block_size_input = int(self.input_rate / float(BLOCKS_PER_SECOND))
+        self.buffer_queue: queue.Queue = queue.Queue(maxsize=int(max_buffered_seconds * BLOCKS_PER_SECOND))
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.resampler = StreamingResampler(input_rate, RATE_PROCESS) if input_rate != RATE_PROCESS else None
+
+        self.chunk = None
+        self.wf = None
+        kwargs = {
+            'format': pyaudio.paInt16,
+            'channels': self.CHANNELS,
+            'rate': self.input_rate,
+            'input': True,
+            'frames_per_buffer': self.block_size_input,
+            'stream_callback': self._callback,
+        }
+        # if not default device
+        if self.device:
+            kwargs['input_device_index'] = self.device
+        elif file is not None:
+            self.chunk = 320
+            self.wf = wave.open(file, 'rb')
+
+        self.pa = pyaudio.PyAudio()
+        self._continue = pyaudio.paContinue
+        self.stream = self.pa.open(**kwargs)
+        self.stream.start_stream()
+
+    frame_duration_ms = property(lambda self: 1000 * self.block_size // self.sample_rate)
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if self.chunk is not None:
+            in_data = self.wf.readframes(self.chunk)
+        self.frames_captured += 1
+        while True:
+            try:
+                self.buffer_queue.put_nowait(in_data)
+                break
+            except queue.Full:
+                try:
+                    self.buffer_queue.get_nowait()
+                    self.frames_dropped += 1
+                except queue.Empty:
+                    pass
+        return None, self._continue
+
+    def resample(self, data: bytes) -> bytes:
+        """
+        Microphone may not support our native processing sampling rate, so
+        resample from input_rate to RATE_PROCESS here for webrtcvad and stt.
+        Blocks must be passed in stream order, the resampler carries its filter state from one to the next.
+        """
+        return self.resampler.resample(data)
+
+    def read(self) -> bytes:
+        """Return a block of audio data at RATE_PROCESS, blocking if necessary."""
+        data = self.buffer_queue.get()
+        return data if self.resampler is None else self.resample(data)
+
+    def frames(self) -> Iterator[bytes]:
+        while True:
+            yield self.read()
+
+    def stats(self) -> Dict[str, int]:
+        return {'captured': self.frames_captured, 'dropped': self.frames_dropped,
+                'buffered': self.buffer_queue.qsize()}
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        self.pa.terminate()
+        if self.wf is not None:
+            self.wf.close()
+
+    def write_wav(self, filename: str, data: bytes):
+        module_logger.info("write wav %s", filename)
+        with wave.open(filename, 'wb') as wf:
+            wf.setnchannels(self.CHANNELS)
+            wf.setsampwidth(2)
+            wf.setframerate(self.sample_rate)
+            wf.writeframes(data)
+
+
+class VoiceSegmenter:
+    """Filter & segment 16-bit mono audio frames with voice activity detection."""
+
+    def __init__(self, aggressiveness: int = 3, sample_rate: int = RATE_PROCESS, padding_ms: int = 300,
+                 ratio: float = 0.75):
+        import webrtcvad
+
+        self.vad = webrtcvad.Vad(aggressiveness)
+        self.sample_rate = sample_rate
+        self.frame_duration_ms = 1000 // BLOCKS_PER_SECOND
+        self.frame_bytes = 2 * sample_rate * self.frame_duration_ms // 1000
+        self.padding_ms = padding_ms
+        self.ratio = ratio
+
+    def vad_collector(self, frames: Iterator[bytes]) -> Iterator[Optional[bytes]]:
+        """Generator that yields series of consecutive audio frames comprising each utterence, separated by yielding a single None.
+            Determines voice activity by ratio of frames in padding_ms. Uses a buffer to include padding_ms prior to being triggered.
+            Stops at the first incomplete frame, the end of a file.
+            Example: (frame, ..., frame, None, frame, ..., frame, None, ...)
+                      |---utterence---|        |---utterence---|
+        """
+        num_padding_frames = self.padding_ms // self.frame_duration_ms
+        ring_buffer = collections.deque(maxlen=num_padding_frames)
+        triggered = False
+
+        for frame in frames:
+            if len(frame) < self.frame_bytes:
+                return
+
+            is_speech = self.vad.is_speech(frame, self.sample_rate)
+
+            if not triggered:
+                ring_buffer.append((frame, is_speech))
+                num_voiced = len([f for f, speech in ring_buffer if speech])
+                if num_voiced > self.ratio * ring_buffer.maxlen:
+                    triggered = True
+                    for f, s in ring_buffer:
+                        yield f
+                    ring_buffer.clear()
+
+            else:
+                yield frame
+                ring_buffer.append((frame, is_speech))
+                num_unvoiced = len([f for f, speech in ring_buffer if not speech])
+                if num_unvoiced > self.ratio * ring_buffer.maxlen:
+                    triggered = False
+                    yield None
+                    ring_buffer.clear()
+
+
+class SpeechListener:
+    """
+    Long-lived capture, segmentation and recognition: one input stream, one VAD and one STT model serve every
+    utterance. Capture keeps buffering while the consumer of utterances() answers, the next STT stream is created
+    as soon as the previous one finished, so nothing has to be set up between utterances.
+    """
+
+    def __init__(self, model: str, scorer: str = None, capture: AudioCapture = None,
+                 segmenter: VoiceSegmenter = None):
+        import stt
+
+        module_logger.info("model: %s", model)
+        self.model = stt.Model(model)
+        if scorer:
+            module_logger.info("scorer: %s", scorer)
+            self.model.enableExternalScorer(scorer)
+        self.capture = capture if capture is not None else AudioCapture()
+        self.segmenter = segmenter if segmenter is not None else VoiceSegmenter()
+
+    def utterances(self, on_partial: Callable[[str], None] = None, partial_interval_ms: int = 200) -> Iterator[str]:
+        """
+        Recognised text of every utterance, empty ones skipped. With on_partial, the intermediate hypothesis of the
+        utterance being spoken is decoded every partial_interval_ms of audio and passed to it.
+        """
+        dropped = self.capture.frames_dropped
+        stream_context = self.model.createStream()
+        partial_frames = max(1, partial_interval_ms // self.segmenter.frame_duration_ms)
+        fed = 0
+        for frame in self.segmenter.vad_collector(self.capture.frames()):
+            if frame is not None:
+                stream_context.feedAudioContent(np.frombuffer(frame, np.int16))
+                fed += 1
+                if on_partial is not None and fed % partial_frames == 0:
+                    on_partial(stream_context.intermediateDecode())
+                continue
+
+            fed = 0
+
+            module_logger.debug("end utterance")
+            text = stream_context.finishStream()
+            stream_context = self.model.createStream()
+            if self.capture.frames_dropped != dropped:
+                module_logger.warning(f"Audio buffer overflowed, {self.capture.frames_dropped - dropped} frames lost")
+                dropped = self.capture.frames_dropped
+            if text != "":
+                yield text
+
+    def close(self):
+        self.capture.close()
@@ -1,12 +1,19 @@
 import hashlib
 import logging
-import os.path
 import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Queue
+from typing import Deque, Dict, List
 
-from TTS.api import TTS
 from pydub import AudioSegment
 from pydub.playback import play
 
+from audio_porcessing.audio_cache import AudioCache
+from audio_porcessing.playback import AudioSink, split_sentences
+from audio_porcessing.pre_synthesis import PreSynthesis, Progress, log_progress
 from core.logic import Stream, Response
 
 # from gtts import gTTS
@@ -42,30 +49,164 @@ module_logger = logging.getLogger(__name__)
 
 
 class CoquiTTSStreamAdapter(Stream):
+    """
+    Speaks responses with Coqui TTS, synthesised audio is cached by text.
 
-    def __init__(self):
-        self.TEMP_PATH: str = "tts_temp_cq"
-        if not os.path.isdir(self.TEMP_PATH):
-            os.mkdir(self.TEMP_PATH)
+    With streaming=True the response is split into sentences, each synthesised and cached on its own, so
+    sentences shared by several responses are reused. Sentence N+1 is synthesised on a worker thread while
+    sentence N plays, and playback starts as soon as the first sentence is ready instead of after the whole text.
+    time_to_first_audio holds the seconds from handle until playback began for the recent responses.
+
+    model_loading is 'eager' to load the TTS model in the constructor, 'background' to load it on a thread
+    meanwhile, or 'lazy' to load it when first needed.
+    """
+    model_name = 'tts_models/en/ljspeech/tacotron2-DCA'
+
+    def __init__(self, cache_path: str = "tts_temp_cq", max_disk_bytes: int = 512 * 2 ** 20,
+                 max_memory_bytes: int = 64 * 2 ** 20, streaming: bool = False, lookahead: int = 1,
+                 model_loading: str = 'background'):
+        self.TEMP_PATH: str = cache_path
+        self.cache = AudioCache(cache_path, max_disk_bytes=max_disk_bytes, max_memory_bytes=max_memory_bytes)
         self.regex_filter = re.compile(r'[^\w.,?!]+')
-        self.tts = TTS('tts_models/en/ljspeech/tacotron2-DCA')
+        self.streaming = streaming
+        # Sentences synthesised ahead of the one playing.
+        self.lookahead = lookahead
+        self.sink = AudioSink()
+        self.time_to_first_audio: Deque[float] = deque(maxlen=100)
+        self._synthesis = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts-synthesis')
+        # One synthesis at a time, handle and prepare may both need the model.
+        self._model_lock = threading.Lock()
+        # Cache key -> audio being produced, a second request for the same text waits for it instead of synthesising.
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._handled = 0
+        self._tts = None
+        self._tts_lock = threading.Lock()
+        if model_loading == 'eager':
+            self._load_model()
+        elif model_loading == 'background':
+            threading.Thread(target=self._load_model, name='tts-model', daemon=True).start()
+        elif model_loading != 'lazy':
+            raise ValueError(f"Unknown model_loading: {model_loading}")
+
+    @property
+    def tts(self):
+        """The TTS model, waits for it while it is still loading."""
+        return self._tts if self._tts is not None else self._load_model()
+
+    def _load_model(self):
+        with self._tts_lock:
+            if self._tts is None:
+                from TTS.api import TTS
+                module_logger.info(f"Loading TTS model {self.model_name}")
+                self._tts = TTS(self.model_name)
+            return self._tts
 
     def text_cleanup(self, text: str):
         return self.regex_filter.sub(' ', text)
 
+    def cache_key(self, text: str) -> str:
+        """Cache key of an already cleaned text."""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def pre_synthesise(self, texts: List[str], processes: int = None, background: bool = False,
+                       progress: Progress = log_progress) -> PreSynthesis:
+        """Fill the cache with texts not cached yet, e.g. CoreBot.static_responses(), see PreSynthesis."""
+        cleaned = [self.text_cleanup(text) for text in texts]
+        if self.streaming:
+            cleaned = [sentence for text in cleaned for sentence in split_sentences(text)]
+        items = [(text, self.cache_key(text)) for text in cleaned]
+        return PreSynthesis(items, self.model_name, self.cache, processes, progress).run(background)
+
+    def prepare(self, output: Response):
+        """Synthesise the response into the cache on the synthesis thread, given up once a response is handled."""
+        text = self.text_cleanup(output.response_text)
+        sentences = split_sentences(text) if self.streaming else [text]
+        handled = self._handled
+
+        def synthesise():
+            for sentence in sentences:
+                if self._handled != handled:
+                    break
+                self._audio(sentence)
+
+        self._synthesis.submit(synthesise)
+
     def handle(self, output: Response):
+        start = time.perf_counter()
+        self._handled += 1
         text = self.text_cleanup(output.response_text)
         module_logger.info("CLEANED: " + text)
 
-        message_bytes = text.encode('ascii')
-        text_hash = hashlib.sha256(message_bytes)
-        filename = f"{self.TEMP_PATH}/{text_hash.hexdigest()}.wav"
-        if not os.path.isfile(filename):
-            module_logger.info("GENERATING: " + filename)
-            self.tts.tts_to_file(text=text,
-                                 file_path=filename)
-        else:
-            module_logger.info("CACHE MATCH: " + filename)
-
-        sound = AudioSegment.silent().append(AudioSegment.from_file(file=filename, format="wav"))
+        if self.streaming:
+            self._stream(split_sentences(text), start)
+            return
+
+        audio = self._audio(text)
+        module_logger.debug(f"Audio cache: {self.cache.stats()}")
+
+        sound = AudioSegment.silent().append(audio)
+        self._first_audio(start)
         play(sound)
+
+    def _audio(self, text: str) -> AudioSegment:
+        def synthesise(file_path: str):
+            with self._model_lock:
+                self.tts.tts_to_file(text=text, file_path=file_path)
+
+        key = self.cache_key(text)
+        with self._pending_lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            # e.g. the response handled while prepare is still synthesising it
+            return pending.result()
+        try:
+            audio = self.cache.get_or_create(key, synthesise)
+            pending.set_result(audio)
+            return audio
+        except BaseException as error:
+            pending.set_exception(error)
+            raise
+        finally:
+            with self._pending_lock:
+                del self._pending[key]
+
+    def _stream(self, sentences: List[str], start: float):
+        ready: Queue = Queue(maxsize=self.lookahead)
+        cancelled = threading.Event()
+
+        def synthesise():
+            try:
+                for sentence in sentences:
+                    if cancelled.is_set():
+                        break
+                    ready.put(self._audio(sentence))
+            finally:
+                ready.put(None)
+
+        synthesis = self._synthesis.submit(synthesise)
+        try:
+            first = True
+            while (audio := ready.get()) is not None:
+                if first:
+                    self._first_audio(start)
+                    first = False
+                self.sink.write(audio)
+        except BaseException:
+            # Unblock and stop the synthesis before giving up on the response.
+            cancelled.set()
+            while ready.get() is not None:
+                pass
+            raise
+        # Surfaces a synthesis error, after playing what was ready.
+        synthesis.result()
+        module_logger.debug(f"Audio cache: {self.cache.stats()}")
+
+    def _first_audio(self, start: float):
+        self.time_to_first_audio.append(time.perf_counter() - start)
+        module_logger.info(f"Time to first audio: {self.time_to_first_audio[-1]:.3f}s")
@@ -0,0 +1,82 @@
+"""
+Memory of loading a CorpusLogicAdapter from a JSON lines export, each way in a fresh process:
+
+    list    every pair read into a list first, the way a corpus used to be handed over
+    stream  CorpusLogicAdapter.from_files, pairs consumed a chunk at a time
+    mapped  CorpusLogicAdapter.load of the saved stream adapter, arrays and strings memory mapped
+
+Peak is the highest resident set size while loading, steady the resident set size after it, both above the
+process right before loading.
+
+    python -m benchmarks.benchmark_corpus_loading --size 1000000
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.synthetic import question_answer_pairs
+from core.adapters import CorpusLogicAdapter, read_pairs
+
+
+def resident_megabytes() -> float:
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_megabytes() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(mode: str, path: str, directory: str, results: multiprocessing.Queue):
+    # Importing and warming the analyser happens before the baseline, only the corpus is measured.
+    CorpusLogicAdapter([['warm up', 'warm up']])
+    gc.collect()
+    before = resident_megabytes()
+    start = time.perf_counter()
+    if mode == 'list':
+        adapter = CorpusLogicAdapter([list(pair) for pair in read_pairs(path)])
+    elif mode == 'stream':
+        adapter = CorpusLogicAdapter.from_files([path])
+        adapter.save(directory)
+    else:
+        adapter = CorpusLogicAdapter.load(directory)
+    seconds = time.perf_counter() - start
+    # A question is answered, so mapped pages that lookups touch count towards the steady state.
+    adapter.process('paper jam in the duplex unit', {})
+    gc.collect()
+    results.put((mode, seconds, max(peak_megabytes(), before) - before, resident_megabytes() - before))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak and steady memory of loading a corpus')
+    parser.add_argument('--size', type=int, default=1_000_000, help='question answer pairs in the export')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'corpus.jsonl')
+    with open(path, 'w', encoding='utf-8') as file:
+        for question, answer in question_answer_pairs(args.size):
+            file.write(json.dumps({'question': question, 'answer': answer}) + '\n')
+    print(f'{args.size} pairs, {os.path.getsize(path) / 2 ** 20:.1f} MB of JSON lines')
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    print(f'{"mode":>8} {"load s":>8} {"peak MB":>9} {"steady MB":>10}')
+    for mode in ['list', 'stream', 'mapped']:
+        process = context.Process(target=measure, args=(mode, path, directory, results))
+        process.start()
+        mode, seconds, peak, steady = results.get()
+        process.join()
+        print(f'{mode:>8} {seconds:>8.1f} {peak:>9.1f} {steady:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import question_answer_pairs
+from core.adapters import CorpusLogicAdapter
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def lookup_latencies(adapter: CorpusLogicAdapter, queries, writer=None):
+    """Lookup latencies in ms, optionally while another thread keeps adding pairs."""
+    stop = threading.Event()
+
+    def keep_writing():
+        while not stop.is_set():
+            writer()
+
+    if writer is not None:
+        thread = threading.Thread(target=keep_writing)
+        thread.start()
+    latencies = []
+    for query in queries:
+        latencies.append(timed(adapter.process, query, {})[1] * 1000)
+    stop.set()
+    if writer is not None:
+        thread.join()
+    return np.array(latencies)
+
+
+def benchmark(size: int, batch: int, queries: int):
+    pairs = question_answer_pairs(size + batch)
+    corpus, update = pairs[:size], pairs[size:]
+    questions = [question for question, _ in pairs[::max(1, len(pairs) // queries)]][:queries]
+
+    adapter, build = timed(CorpusLogicAdapter, corpus)
+    _, rebuild = timed(CorpusLogicAdapter, pairs)
+    _, add = timed(adapter.add_pairs, update)
+    _, remove = timed(adapter.remove_pairs, update)
+    idle = lookup_latencies(adapter, questions)
+    busy = lookup_latencies(adapter, questions, writer=lambda: adapter.add_pairs(update[:10]))
+
+    print(f'{size:>9} pairs | build {build:8.2f}s | rebuild +{batch} {rebuild:8.2f}s | '
+          f'add {batch} {add * 1000:8.1f}ms | remove {batch} {remove * 1000:8.1f}ms | '
+          f'lookup p50/p99 {np.percentile(idle, 50):6.2f}/{np.percentile(idle, 99):6.2f}ms | '
+          f'during updates {np.percentile(busy, 50):6.2f}/{np.percentile(busy, 99):6.2f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Incremental CorpusLogicAdapter updates compared with a full rebuild')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        benchmark(size, args.batch, args.queries)
@@ -0,0 +1,71 @@
+"""
+Low-rank dense retrieval compared with sparse TF-IDF scoring: memory, fitting time, latency and top-1 agreement.
+
+Queries are corpus questions with a word dropped and another replaced, the way STT output differs from the
+written question; "found" counts queries whose original pair comes out on top.
+
+    python -m benchmarks.benchmark_dense_retrieval --sizes 10000 100000 --dimensions 256
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import question_answer_pairs, vocabulary
+from core.adapters import CorpusLogicAdapter
+
+
+def noisy(questions, words, seed: int = 1):
+    rng = random.Random(seed)
+    queries = []
+    for question in questions:
+        tokens = question.split()
+        if len(tokens) > 2:
+            del tokens[rng.randrange(len(tokens))]
+        tokens[rng.randrange(len(tokens))] = rng.choice(words)
+        queries.append(' '.join(tokens))
+    return queries
+
+
+def benchmark(size: int, queries: int, dimensions: int):
+    pairs = question_answer_pairs(size)
+    rng = random.Random(0)
+    targets = rng.sample(range(size), queries)
+    questions = noisy([pairs[idx][0] for idx in targets], vocabulary(20000))
+
+    adapter = CorpusLogicAdapter(pairs)
+    modes = {'sparse': None}
+    for name, quantize in [('float32', False), ('int8', True)]:
+        start = time.perf_counter()
+        modes[name] = adapter.fit_dense(dimensions, quantize=quantize)
+        print(f'{size:>9} pairs | fitted {name} {dimensions} dimensions in {time.perf_counter() - start:6.1f}s')
+
+    top = {}
+    for name, dense in modes.items():
+        adapter.dense = dense
+        adapter.top_k(questions[0], 1)
+        latencies, top[name] = [], []
+        for question in questions:
+            start = time.perf_counter()
+            top[name].append(adapter.index.search(question, 1).ids[0] if dense is None
+                             else dense.search(adapter.index, question, 1).ids[0])
+            latencies.append(time.perf_counter() - start)
+        memory = adapter.index.nbytes if dense is None else dense.nbytes
+        agreement = np.mean(np.array(top[name]) == np.array(top['sparse']))
+        found = np.mean(np.array(top[name]) == np.array(targets))
+        print(f'{size:>9} pairs | {name:>7} | {memory / 2 ** 20:8.1f} MB | p50 {np.median(latencies) * 1000:7.3f}ms '
+              f'p99 {np.percentile(latencies, 99) * 1000:7.3f}ms | top-1 agreement {agreement:6.1%} | '
+              f'found {found:6.1%}')
+    adapter.drop_dense()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Truncated SVD retrieval compared with sparse TF-IDF')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--dimensions', type=int, default=256)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        benchmark(size, args.queries, args.dimensions)
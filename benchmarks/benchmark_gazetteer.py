@@ -0,0 +1,131 @@
+"""
+FuzzyGazetteer compared with exhaustive search: the same (key, entity) pairs for every input, and the time of both.
+
+The reference tries every entity at every start within every token, or window of as many tokens as the entity has
+words, with a plain Levenshtein table, so it checks the pigeonhole filter and the bit-parallel verification of
+FuzzyGazetteer together. With fuzzysearch installed, find_near_matches on single tokens is a second reference.
+Gazetteers are drawn from a few syllables, and inputs mix random words with entities carrying random typos, so most
+inputs hold near-occurrences and many entities nearly match each other.
+
+    python -m benchmarks.benchmark_gazetteer --gazetteers 300 --inputs 20
+"""
+import argparse
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.synthetic import entities, vocabulary
+from core.gazetteer import FuzzyGazetteer
+
+
+def levenshtein_within(entity: str, window: str, limit: int, first_end: int, last_start: int) -> bool:
+    """Whether some window[begin:end], begin < first_end and end > last_start, is within limit edits of entity."""
+    for begin in range(min(first_end, len(window)) if entity else 1):
+        row = list(range(len(window) - begin + 1))
+        for char in entity:
+            previous, row[0] = row[0], row[0] + 1
+            for column in range(1, len(row)):
+                previous, row[column] = row[column], min(
+                    row[column] + 1, row[column - 1] + 1, previous + (char != window[begin + column - 1]))
+        if any(row[length] <= limit for length in range(len(row)) if begin + length > last_start):
+            return True
+    return False
+
+
+def fuzzysearch_within(entity: str, window: str, limit: int, first_end: int, last_start: int) -> bool:
+    """
+    find_near_matches on single tokens. It keeps only the best of overlapping matches, which may not be one
+    spanning a window of several tokens from the first to the last, so those windows go to levenshtein_within.
+    """
+    from fuzzysearch import find_near_matches
+    if first_end < len(window) or last_start > 0:
+        return levenshtein_within(entity, window, limit, first_end, last_start)
+    return bool(find_near_matches(entity, window, max_l_dist=limit))
+
+
+def exhaustive(gazetteer: FuzzyGazetteer, tokens: List[str], within) -> List[Tuple[str, str]]:
+    tokens = [token.lower() for token in tokens]
+    found = []
+    for start in range(len(tokens)):
+        for entry in range(len(gazetteer)):
+            key, entity, normalised, distance, words = gazetteer.entry(entry)
+            for size in sorted({1, words}):
+                if start + size > len(tokens):
+                    continue
+                window = ' '.join(tokens[start:start + size])
+                last_start = len(window) - len(tokens[start + size - 1])
+                if within(normalised, window, distance, len(tokens[start]), last_start):
+                    found.append((key, entity))
+                    break
+    return found
+
+
+def typo(text: str, rng: random.Random) -> str:
+    position = rng.randrange(len(text))
+    edit = rng.choice('ids')
+    if edit == 'i':
+        return text[:position] + rng.choice('aeiou') + text[position:]
+    if edit == 'd':
+        return text[:position] + text[position + 1:]
+    return text[:position] + rng.choice('aeiou') + text[position + 1:]
+
+
+def inputs(gazetteer: Dict[str, List[str]], count: int, rng: random.Random) -> List[List[str]]:
+    names = [entity for values in gazetteer.values() for entity in values]
+    words = vocabulary(200, rng.randrange(1000))
+    utterances = []
+    for _ in range(count):
+        tokens = rng.sample(words, rng.randint(2, 6))
+        for _ in range(rng.randint(0, 2)):
+            entity = rng.choice(names)
+            for _ in range(rng.randint(0, 2)):
+                entity = typo(entity, rng) or entity
+            tokens.insert(rng.randrange(len(tokens) + 1), entity)
+        utterances.append(' '.join(tokens).split())
+    return utterances
+
+
+def compare(gazetteers: int, size: int, count: int, fuzzysearch: bool, seed: int):
+    rng = random.Random(seed)
+    references = {'exhaustive': levenshtein_within}
+    if fuzzysearch:
+        references['fuzzysearch'] = fuzzysearch_within
+    mismatches = {name: 0 for name in references}
+    seconds = {name: 0.0 for name in ['gazetteer', *references]}
+    example: Optional[tuple] = None
+    lookups = 0
+    for number in range(gazetteers):
+        gazetteer = entities(size, keys=3, seed=seed + number)
+        matcher = FuzzyGazetteer(gazetteer)
+        for tokens in inputs(gazetteer, count, rng):
+            start = time.perf_counter()
+            found = matcher.find(tokens)
+            seconds['gazetteer'] += time.perf_counter() - start
+            lookups += 1
+            for name, within in references.items():
+                start = time.perf_counter()
+                expected = exhaustive(matcher, tokens, within)
+                seconds[name] += time.perf_counter() - start
+                if found != expected:
+                    mismatches[name] += 1
+                    example = example or (name, tokens, found, expected)
+
+    print(f'{gazetteers} gazetteers of {size} entities, {lookups} inputs')
+    for name, spent in seconds.items():
+        mismatched = f' | mismatching inputs {mismatches[name]}' if name in mismatches else ''
+        print(f'{name:>12} {spent / lookups * 1000:9.3f}ms per input{mismatched}')
+    if example is not None:
+        name, tokens, found, expected = example
+        print(f'first mismatch against {name}: {tokens}\n  found    {found}\n  expected {expected}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='FuzzyGazetteer against exhaustive approximate search')
+    parser.add_argument('--gazetteers', type=int, default=300, help='random gazetteers to compare on')
+    parser.add_argument('--entities', type=int, default=30, help='entities per gazetteer')
+    parser.add_argument('--inputs', type=int, default=20, help='inputs per gazetteer')
+    parser.add_argument('--no-fuzzysearch', action='store_true', help='skip the fuzzysearch reference')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    compare(args.gazetteers, args.entities, args.inputs, not args.no_fuzzysearch, args.seed)
@@ -0,0 +1,41 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import question_answer_pairs, sentences, vocabulary
+from core.adapters import CorpusLogicAdapter
+
+
+def benchmark(size: int, queries: int, k: int):
+    pairs = question_answer_pairs(size)
+    exhaustive = CorpusLogicAdapter(pairs)
+    pruned = CorpusLogicAdapter(pairs, pruned=True)
+    questions = sentences(queries, vocabulary(20000), length=4, seed=1)
+    pruned.index.search(questions[0], k)
+
+    agree, scored, latency = 0, [], {'exhaustive': [], 'pruned': []}
+    for question in questions:
+        start = time.perf_counter()
+        expected = exhaustive.index.search(question, k)
+        latency['exhaustive'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        result = pruned.index.search(question, k)
+        latency['pruned'].append(time.perf_counter() - start)
+        agree += np.array_equal(expected.ids, result.ids)
+        scored.append(result.scored)
+
+    print(f'{size:>9} pairs | scored per query mean {np.mean(scored):9.1f} ({np.mean(scored) / size:6.2%}) '
+          f'max {np.max(scored):8d} | exhaustive {np.mean(latency["exhaustive"]) * 1000:7.2f}ms | '
+          f'pruned {np.mean(latency["pruned"]) * 1000:7.2f}ms | top-{k} agreement {agree}/{queries}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inverted-index pruning compared with exhaustive cosine scoring')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=1)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        benchmark(size, args.queries, args.k)
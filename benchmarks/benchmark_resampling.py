@@ -0,0 +1,63 @@
+import argparse
+import time
+
+import numpy as np
+from scipy import signal
+
+from audio_porcessing.resampling import StreamingResampler
+
+OUTPUT_RATE = 16000
+BLOCKS_PER_SECOND = 50
+
+
+def fft_resample(data: bytes, input_rate: int) -> bytes:
+    """The per-block FFT resampling AudioCapture used before StreamingResampler."""
+    data16 = np.frombuffer(data, dtype=np.int16)
+    resample = signal.resample(data16, int(len(data16) / input_rate * OUTPUT_RATE))
+    return np.array(resample, dtype=np.int16).tobytes()
+
+
+def microphone(rate: int, seconds: float) -> np.ndarray:
+    """A tone sweep with some noise, loud enough to use most of the 16-bit range."""
+    t = np.arange(int(rate * seconds)) / rate
+    rng = np.random.default_rng(0)
+    sweep = np.sin(2 * np.pi * (200 + 1500 * t / seconds) * t) * 12000 + rng.standard_normal(len(t)) * 500
+    return sweep.astype(np.int16)
+
+
+def snr(output: np.ndarray, reference: np.ndarray, delay: int = 0) -> float:
+    """Signal to noise ratio in dB of an output lagging delay samples behind the whole-signal resample_poly."""
+    output = output[delay:].astype(np.float64)
+    length = min(len(output), len(reference))
+    output, reference = output[:length], reference[:length]
+    return 10 * np.log10(np.sum(reference ** 2) / np.sum((output - reference) ** 2))
+
+
+def benchmark(rate: int, seconds: float):
+    samples = microphone(rate, seconds)
+    block = rate // BLOCKS_PER_SECOND
+    blocks = [samples[start:start + block].tobytes() for start in range(0, len(samples) - block + 1, block)]
+    reference = signal.resample_poly(samples.astype(np.float64), OUTPUT_RATE, rate)
+
+    start = time.process_time()
+    fft = np.frombuffer(b''.join(fft_resample(data, rate) for data in blocks), dtype=np.int16)
+    fft_seconds = time.process_time() - start
+
+    resampler = StreamingResampler(rate, OUTPUT_RATE)
+    start = time.process_time()
+    streamed = np.frombuffer(b''.join(resampler.resample(data) for data in blocks), dtype=np.int16)
+    streamed_seconds = time.process_time() - start
+
+    print(f'{rate:>6} Hz | per-block FFT {fft_seconds / seconds * 1000:7.2f} ms CPU/s audio, '
+          f'SNR {snr(fft, reference):5.1f} dB | streaming polyphase {streamed_seconds / seconds * 1000:7.2f} ms '
+          f'CPU/s audio, SNR {snr(streamed, reference, resampler.delay):5.1f} dB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CPU cost of resampling 20ms microphone blocks to 16kHz')
+    parser.add_argument('--rates', type=int, nargs='+', default=[44100, 48000])
+    parser.add_argument('--seconds', type=float, default=60)
+    args = parser.parse_args()
+
+    for rate in args.rates:
+        benchmark(rate, args.seconds)
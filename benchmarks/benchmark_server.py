@@ -0,0 +1,103 @@
+"""
+Load generator for BotServer: throughput against the number of workers, and the memory every worker adds.
+
+A corpus bot is built once, or loaded memory mapped from a directory written by CorpusLogicAdapter.save, and
+served on a Unix socket. For every worker count as many client processes send requests over their own
+connection. Throughput should grow with the workers up to the number of cores while the private memory of each
+worker stays flat, the corpus being shared. With --entities the bot also extracts entities of a gazetteer that
+large, loaded memory mapped like the corpus, and every request names one of them.
+
+    python -m benchmarks.benchmark_server --size 100000 --workers 1 2 4 8
+    python -m benchmarks.benchmark_server --size 100000 --entities 50000 --workers 1 2 4 8
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.synthetic import entities, question_answer_pairs
+from core.adapters import CorpusLogicAdapter, LowConfidenceAdapter
+from core.logic import CoreBot, EntityExtractorAdapter
+from core.server import BotClient, BotServer
+
+
+def private_megabytes(pid: int) -> Dict[str, float]:
+    """Memory only this process holds and its proportional share of shared memory, from /proc on Linux."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as file:
+        for line in file:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0]) / 1024
+    return {'private_mb': fields['Private_Clean'] + fields['Private_Dirty'], 'pss_mb': fields['Pss']}
+
+
+def client(socket_path: str, questions: List[str]) -> Tuple[float, float]:
+    with BotClient(socket_path) as connection:
+        connection.ask(questions[0])
+        start = time.perf_counter()
+        for question in questions:
+            connection.ask(question)
+        return start, time.perf_counter()
+
+
+def load(socket_path: str, clients: int, questions: List[str]) -> float:
+    """Requests per second of clients processes asking all questions each, over the same period."""
+    with multiprocessing.get_context('fork').Pool(clients) as pool:
+        spans = pool.starmap(client, [(socket_path, questions[idx:] + questions[:idx]) for idx in range(clients)])
+    return clients * len(questions) / (max(end for _, end in spans) - min(start for start, _ in spans))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BotServer throughput and memory against workers')
+    parser.add_argument('--size', type=int, default=100_000, help='question answer pairs in the corpus')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument('--requests', type=int, default=500, help='requests per client')
+    parser.add_argument('--index', help='directory of a saved corpus to map instead of building one')
+    parser.add_argument('--entities', type=int, default=0, help='entities in a gazetteer to extract, none by default')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    directory = args.index
+    if directory is None:
+        directory = tempfile.mkdtemp()
+        CorpusLogicAdapter(question_answer_pairs(args.size)).save(directory)
+    questions = [question for question, _ in question_answer_pairs(args.requests, seed=1)]
+    gazetteer = None
+    if args.entities:
+        gazetteer = tempfile.mkdtemp()
+        names = entities(args.entities)
+        EntityExtractorAdapter(names).save(gazetteer)
+        names = [name for values in names.values() for name in values]
+        questions = [f'{question} {names[idx * 7919 % len(names)]}' for idx, question in enumerate(questions)]
+
+    def bot_factory() -> CoreBot:
+        bot = CoreBot()
+        if gazetteer is not None:
+            bot.add_pre_processors([EntityExtractorAdapter.load(gazetteer)])
+        bot.add_logic_adapters([CorpusLogicAdapter.load(directory), LowConfidenceAdapter(0.2, 'Sorry?')])
+        return bot
+
+    socket_path = os.path.join(tempfile.mkdtemp(), 'bot.sock')
+    print(f'{os.cpu_count()} cores, corpus in {directory}' + (f', gazetteer in {gazetteer}' if gazetteer else ''))
+    print(f'{"workers":>8} {"requests/s":>11} {"speedup":>8} {"private MB/worker":>18} {"PSS MB/worker":>14}')
+    single = None
+    for workers in sorted(set(args.workers)):
+        server = BotServer(bot_factory, socket_path, workers)
+        server.start()
+        try:
+            throughput = load(socket_path, workers, questions)
+            memory = [private_megabytes(process.pid) for process in server.processes]
+        finally:
+            server.stop()
+        single = single or throughput
+        print(f'{workers:>8} {throughput:>11.1f} {throughput / single:>7.2f}x '
+              f'{sum(m["private_mb"] for m in memory) / workers:>18.1f} '
+              f'{sum(m["pss_mb"] for m in memory) / workers:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
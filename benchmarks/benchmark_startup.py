@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+# Runs in a fresh interpreter, so every measurement starts with cold imports.
+PROBE = '''
+import json, time
+start = time.perf_counter()
+import core.logic, core.adapters
+imported = time.perf_counter()
+from benchmarks.synthetic import question_answer_pairs
+from core.adapters import CorpusLogicAdapter, LowConfidenceAdapter, BinaryConvertRegexLogicAdapter
+from core.logic import CoreBot, EntityExtractorAdapter
+bot = CoreBot()
+bot.add_pre_processors([EntityExtractorAdapter({'city': ['Cracow', 'Warsaw', 'New York']})])
+bot.add_logic_adapters([CorpusLogicAdapter(question_answer_pairs(PAIRS)), LowConfidenceAdapter(0.2, 'Sorry'),
+                        BinaryConvertRegexLogicAdapter()])
+built = time.perf_counter()
+bot.ask('what is the weather in cracow')
+first = time.perf_counter()
+bot.ask('convert binary 1010')
+second = time.perf_counter()
+tts = None
+try:
+    import audio_porcessing.text_to_speech
+    tts = time.perf_counter() - second
+except ImportError:
+    pass
+print(json.dumps({'import core': imported - start, 'build bot': built - imported, 'first ask': first - built,
+                  'second ask': second - first, 'import text_to_speech': tts}))
+'''
+
+
+def measure(pairs: int) -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    output = subprocess.run([sys.executable, '-c', PROBE.replace('PAIRS', str(pairs))], cwd=root, env=environment,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import and first ask() latency of a freshly started bot')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--pairs', type=int, default=1000)
+    args = parser.parse_args()
+
+    runs = [measure(args.pairs) for _ in range(args.runs)]
+    for stage in runs[0]:
+        values = [run[stage] for run in runs if run[stage] is not None]
+        if not values:
+            print(f'{stage:>22} | unavailable')
+            continue
+        print(f'{stage:>22} | median {np.median(values) * 1000:8.1f}ms | max {np.max(values) * 1000:8.1f}ms')
@@ -0,0 +1,208 @@
+"""
+Reproducible CoreBot benchmark suite, offline and on CPU only.
+
+Every case builds a bot from synthetic data with fixed seeds and measures CoreBot.ask latency percentiles and
+throughput along one axis: corpus size, gazetteer size, number of regex adapters or input length. Audio cases
+measure CPU milliseconds per second of audio of VAD segmentation and resampling. Results are written as JSON;
+given a baseline file, every case whose primary metric got slower by more than the threshold is reported and the
+suite exits with status 1.
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --baseline results.json --threshold 0.2
+"""
+import argparse
+import json
+import logging
+import platform
+import re
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.synthetic import entities, question_answer_pairs, sentences, speech, vocabulary
+from core.adapters import CorpusLogicAdapter, LowConfidenceAdapter
+from core.logic import CoreBot, EntityExtractorAdapter, RegexLogicAdapter, Response, match_value
+from core.text import Utterance
+
+AXES = {
+    'corpus': [100, 1_000, 10_000, 100_000, 1_000_000],
+    'entities': [10, 100, 1_000, 10_000],
+    'regex': [1, 10, 100],
+    'input_words': [4, 16, 64, 256],
+}
+QUICK_AXES = {
+    'corpus': [100, 1_000, 10_000],
+    'entities': [10, 100, 1_000, 10_000],
+    'regex': [1, 10, 100],
+    'input_words': [4, 16, 64],
+}
+
+
+def regex_adapters(count: int) -> List[RegexLogicAdapter]:
+    """Adapters shaped like BinaryConvertRegexLogicAdapter, each with its own pattern and keyword."""
+    adapters = []
+    for idx in range(count):
+        class SyntheticRegexLogicAdapter(RegexLogicAdapter):
+            pattern = re.compile(rf'code{idx}-(\d+)', flags=re.IGNORECASE)
+            keywords = [f'keyword{idx}']
+
+            def process_matches(self, input_text, matches, keywords, session) -> Response:
+                value = match_value(matches[0])
+                return Response(f'Code {value}', self.calculate_confidence(value, input_text, keywords))
+
+        adapters.append(SyntheticRegexLogicAdapter())
+    return adapters
+
+
+def bot_for(axis: str, value: int) -> CoreBot:
+    bot = CoreBot()
+    bot.add_logic_adapters([LowConfidenceAdapter(0.2, 'Sorry i dont understand.')])
+    if axis == 'corpus':
+        bot.add_logic_adapters([CorpusLogicAdapter(question_answer_pairs(value))])
+    elif axis == 'entities':
+        bot.add_pre_processors([EntityExtractorAdapter(entities(value))])
+    elif axis == 'regex':
+        bot.add_logic_adapters(regex_adapters(value))
+    elif axis == 'input_words':
+        bot.add_pre_processors([EntityExtractorAdapter(entities(100))])
+        bot.add_logic_adapters([CorpusLogicAdapter(question_answer_pairs(10_000))] + regex_adapters(10))
+    return bot
+
+
+def latency(ask: Callable[[str], object], inputs: List[str], warmup: int) -> Dict[str, float]:
+    for text in inputs[:warmup]:
+        ask(text)
+    timings = []
+    start = time.perf_counter()
+    for text in inputs[warmup:]:
+        begin = time.perf_counter()
+        ask(text)
+        timings.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+    milliseconds = np.array(timings) * 1000
+    return {
+        'p50_ms': float(np.percentile(milliseconds, 50)),
+        'p90_ms': float(np.percentile(milliseconds, 90)),
+        'p99_ms': float(np.percentile(milliseconds, 99)),
+        'mean_ms': float(milliseconds.mean()),
+        'throughput_per_s': len(timings) / elapsed,
+        'primary': 'p50_ms',
+    }
+
+
+def ask_case(axis: str, value: int, queries: int) -> Dict[str, float]:
+    build = time.perf_counter()
+    bot = bot_for(axis, value)
+    build = time.perf_counter() - build
+    words = vocabulary(20000)
+    length = value if axis == 'input_words' else 8
+    inputs = sentences(queries + queries // 10, words, length=length, seed=1)
+    # Some inputs carry a code and a keyword, so regex adapters answer now and then.
+    inputs = [f'{text} code{idx % 7}-{idx} keyword{idx % 5}' if idx % 3 == 0 else text
+              for idx, text in enumerate(inputs)]
+    result = latency(bot.ask, inputs, warmup=queries // 10)
+    result['build_s'] = build
+    if axis == 'entities':
+        # Latency follows the entities actually found more than the size of the gazetteer.
+        extractor = bot.pre_processors[0]
+        result['found_per_input'] = float(np.mean([len(extractor.gazetteer.find(Utterance.of(text).tokens))
+                                                   for text in inputs]))
+    return result
+
+
+def audio_case(name: str, seconds: float) -> Optional[Dict[str, float]]:
+    if name == 'vad':
+        try:
+            from audio_porcessing.speech_to_text import VoiceSegmenter
+            segmenter = VoiceSegmenter()
+        except ImportError:
+            return None
+        samples = speech(seconds)
+        frames = [samples[start:start + 320].tobytes() for start in range(0, len(samples) - 319, 320)]
+        run = lambda: sum(1 for _ in segmenter.vad_collector(iter(frames)))
+    else:
+        from audio_porcessing.resampling import StreamingResampler
+        rate = int(name.split('_')[1])
+        samples = speech(seconds, rate)
+        block = rate // 50
+        blocks = [samples[start:start + block].tobytes() for start in range(0, len(samples) - block + 1, block)]
+        resampler = StreamingResampler(rate, 16000)
+        run = lambda: [resampler.process(data) for data in blocks]
+
+    run()
+    start = time.process_time()
+    run()
+    return {'ms_per_audio_second': (time.process_time() - start) * 1000 / seconds, 'primary': 'ms_per_audio_second'}
+
+
+def run_suite(axes: Dict[str, List[int]], queries: int, audio_seconds: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for axis, values in axes.items():
+        for value in values:
+            case = f'ask/{axis}={value}'
+            results[case] = ask_case(axis, value, queries)
+            found = results[case].get('found_per_input')
+            print(f'{case:<28} p50 {results[case]["p50_ms"]:8.3f}ms  p99 {results[case]["p99_ms"]:8.3f}ms  '
+                  f'{results[case]["throughput_per_s"]:9.1f}/s' + ('' if found is None else f'  {found:6.1f} found'),
+                  flush=True)
+    for name in ['vad', 'resample_44100', 'resample_48000']:
+        result = audio_case(name, audio_seconds)
+        if result is None:
+            print(f'audio/{name:<22} skipped, dependency not installed')
+            continue
+        results[f'audio/{name}'] = result
+        print(f'audio/{name:<22} {result["ms_per_audio_second"]:8.3f}ms CPU per audio second', flush=True)
+    return results
+
+
+def regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                threshold: float) -> List[str]:
+    """Cases whose primary metric is more than threshold (a fraction) above the baseline, lower is better."""
+    found = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        metric = result['primary']
+        before, after = baseline[case][metric], result[metric]
+        if before > 0 and after > before * (1 + threshold):
+            found.append(f'{case}: {metric} {before:.3f} -> {after:.3f} (+{after / before - 1:.0%})')
+    return found
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='CoreBot benchmark suite')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown, 0.2 is 20%%')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--audio-seconds', type=float, default=30)
+    parser.add_argument('--full', action='store_true', help='include the 1M pair corpus')
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    results = run_suite(AXES if args.full else QUICK_AXES, args.queries, args.audio_seconds)
+    report = {
+        'environment': {'python': platform.python_version(), 'machine': platform.machine(),
+                        'processor': platform.processor(), 'numpy': np.__version__, 'time': time.time()},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        found = regressions(results, baseline, args.threshold)
+        for regression in found:
+            print(f'REGRESSION {regression}')
+        if found:
+            return 1
+        print(f'No regression above {args.threshold:.0%} against {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import random
+from itertools import accumulate
+from typing import Dict, List
+
+import numpy as np
+
+SYLLABLES = ['pa', 'per', 'jam', 'ton', 'er', 'ink', 'dru', 'm', 'lin', 'es', 'scan', 'ner', 'fax', 'tray', 'du', 'plex']
+
+
+def vocabulary(size: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+def sentences(count: int, words: List[str], length: int = 8, seed: int = 0) -> List[str]:
+    """Sentences with Zipf distributed words, so term frequencies look like natural text."""
+    rng = random.Random(seed)
+    cum_weights = list(accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    return [
+        ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(max(1, length // 2), length)))
+        for _ in range(count)
+    ]
+
+
+def question_answer_pairs(count: int, vocabulary_size: int = 20000, seed: int = 0) -> List[List[str]]:
+    words = vocabulary(vocabulary_size, seed)
+    questions = sentences(count, words, seed=seed)
+    return [[question, f'Answer number {idx}.'] for idx, question in enumerate(questions)]
+
+
+def entities(count: int, keys: int = 10, seed: int = 0) -> Dict[str, List[str]]:
+    """Gazetteer of count entities of one to three words, spread over keys entity types."""
+    rng = random.Random(seed)
+    words = vocabulary(max(count, 100), seed + 1)
+    gazetteer: Dict[str, List[str]] = {f'type{key}': [] for key in range(keys)}
+    for idx in range(count):
+        gazetteer[f'type{idx % keys}'].append(' '.join(rng.sample(words, rng.randint(1, 3))))
+    return gazetteer
+
+
+def speech(seconds: float, rate: int = 16000, seed: int = 0) -> np.ndarray:
+    """16-bit mono audio alternating voiced-like tone bursts and near silence, a second each."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    voiced = (t.astype(int) % 2) == 0
+    audio = np.sin(2 * np.pi * 180 * t) * 6000 * voiced + np.sin(2 * np.pi * 900 * t) * 2000 * voiced
+    return (audio + rng.standard_normal(len(t)) * 60).astype(np.int16)
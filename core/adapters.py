@@ -1,24 +1,45 @@
+from __future__ import annotations
+
+import csv
+import hashlib
+import json
+import logging
+import os
 import random
 import re
+import threading
 from abc import ABCMeta
+from itertools import islice
 from operator import itemgetter
-from typing import Union, List
+from typing import Any, Union, List, Hashable, Iterable, Iterator, Sequence, Tuple, Optional, Set
+
+import numpy as np
 
-import nltk
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from core.dense import DenseIndex
+from core.index import TfidfIndex
+from core.logic import LogicAdapter, Response, RegexLogicAdapter, match_value
+from core.string_table import StringTable
+from core.text import Utterance, analyze
 
-from core.logic import LogicAdapter, Response, RegexLogicAdapter
+module_logger = logging.getLogger(__name__)
 
-nltk.download('stopwords', quiet=True)
-stop_words = nltk.corpus.stopwords.words('english')
+
+def __getattr__(name: str) -> Any:
+    # stop_words used to be defined here, it is resolved lazily by core.text now.
+    if name == 'stop_words':
+        from core import text
+        return text.stop_words
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class LowConfidenceAdapter(LogicAdapter, metaclass=ABCMeta):
+    cost = 0.01
+    fallback = True
 
     def __init__(self, confidence: float, response: Union[str, List[str]]) -> None:
         super().__init__()
         self.confidence = confidence
+        self.max_confidence = confidence
 
         if isinstance(response, list):
             self.responses = response
@@ -31,36 +52,192 @@ class LowConfidenceAdapter(LogicAdapter, metaclass=ABCMeta):
     def process(self, input_text: str, session: dict) -> Response:
         return Response(random.choice(self.responses), self.confidence)
 
+    def static_responses(self) -> List[str]:
+        return list(self.responses)
 
-class CorpusLogicAdapter(LogicAdapter):
 
-    def __init__(self, question_answer: List[List[str]]) -> None:
+class CorpusLogicAdapter(LogicAdapter):
+    cpu_bound = True
+    cost = 5.0
+    max_confidence = 1.0
+    pure = True
+
+    def __init__(self, question_answer: Iterable[Sequence[str]] = (), pruned: bool = False,
+                 chunk_size: int = 10_000) -> None:
+        """
+        question_answer may be any iterable, e.g. read_pairs of a file: it is consumed chunk_size pairs at a time,
+        so only one chunk of Python strings is alive while the index is built.
+        """
         super().__init__()
-        self.question_answer = question_answer
+        # Packed by id, removed pairs keep their strings, their hash becomes 0.
+        self.questions = StringTable()
+        self.answers = StringTable()
+        self._pair_hashes: List[np.ndarray] = []
+        self.index = TfidfIndex(analyze, pruned=pruned)
+        # One writer at a time, the tables, hashes and index each number the pairs on their own.
+        self._lock = threading.Lock()
+        # Low-rank retrieval instead of sparse scoring once fit_dense was called.
+        self.dense: Optional[DenseIndex] = None
+        self._dense_fits = 0
+        iterator = iter(question_answer)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                break
+            self.add_pairs(chunk)
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str], question_field: str = 'question', answer_field: str = 'answer',
+                   **options) -> CorpusLogicAdapter:
+        """Adapter streaming the pairs of .jsonl and .csv files, see read_pairs."""
+        return cls((pair for path in paths for pair in read_pairs(path, question_field, answer_field)), **options)
+
+    @property
+    def question_answer(self) -> List[List[str]]:
+        return [[self.questions[idx], self.answers[idx]] for idx in self._live_ids()]
+
+    def add_pairs(self, question_answer: List[Sequence[str]]):
+        question_answer = [tuple(pair) for pair in question_answer]
+        with self._lock:
+            first = len(self.questions)
+            # Answers are published before the index rows, so a concurrent lookup never sees an id without its answer.
+            self.questions.extend(map(itemgetter(0), question_answer))
+            self.answers.extend(map(itemgetter(1), question_answer))
+            self._pair_hashes.append(np.array([_pair_hash(pair) for pair in question_answer], dtype=np.uint64))
+            ids = self.index.add(map(itemgetter(0), question_answer))
+            if ids != range(first, len(self.questions)):
+                raise RuntimeError(f"Index rows {ids} out of step with pairs {range(first, len(self.questions))}, "
+                                   f"was the index changed directly?")
+
+    def remove_pairs(self, question_answer: List[Sequence[str]]) -> int:
+        ids = []
+        with self._lock:
+            for pair in map(tuple, question_answer):
+                target, offset = _pair_hash(pair), 0
+                for position, hashes in enumerate(self._pair_hashes):
+                    for found in np.flatnonzero(hashes == target):
+                        if (self.questions[offset + found], self.answers[offset + found]) == pair:
+                            if not hashes.flags.writeable:
+                                hashes = self._pair_hashes[position] = hashes.copy()
+                            hashes[found] = 0
+                            ids.append(offset + int(found))
+                    offset += len(hashes)
+            self.index.remove(ids)
+        return len(ids)
+
+    def save(self, directory: str):
+        """Index arrays, packed questions and answers, for load to map them instead of refitting."""
+        with self._lock:
+            self.index.save(directory)
+            self.questions.save(directory, 'questions')
+            self.answers.save(directory, 'answers')
+            np.save(os.path.join(directory, 'pair_hashes.npy'),
+                    np.concatenate([np.zeros(0, np.uint64)] + self._pair_hashes))
+            if self.dense is not None:
+                self.dense.fold_in(self.index)
+                self.dense.save(directory)
+
+    @classmethod
+    def load(cls, directory: str, pruned: bool = False, mmap: bool = True) -> CorpusLogicAdapter:
+        adapter = cls(pruned=pruned)
+        adapter.index = TfidfIndex.load(directory, analyze, mmap=mmap, pruned=pruned)
+        adapter.questions = StringTable.load(directory, 'questions', mmap=mmap)
+        adapter.answers = StringTable.load(directory, 'answers', mmap=mmap)
+        adapter._pair_hashes = [np.load(os.path.join(directory, 'pair_hashes.npy'), mmap_mode='r' if mmap else None)]
+        if os.path.exists(os.path.join(directory, 'dense_vectors.npy')):
+            adapter.dense = DenseIndex.load(directory, adapter.index, mmap=mmap)
+        return adapter
+
+    def fit_dense(self, dimensions: int = 256, quantize: bool = False, **options) -> DenseIndex:
+        """
+        Answer from a truncated SVD of the corpus from now on, see DenseIndex; the sparse index stays the source
+        of the documents. Fitting takes seconds per hundred thousand pairs, it is meant to run before serving or
+        offline with save.
+        """
+        self.dense = DenseIndex(self.index, dimensions, quantize, **options)
+        self._dense_fits += 1
+        return self.dense
+
+    def drop_dense(self):
+        self.dense = None
+        self._dense_fits += 1
 
     def can_process(self, input_text, session: dict) -> bool:
-        return True
+        return self.index.document_count > 0
 
     def process(self, input_text: str, session: dict) -> Response:
-        corpus = list(map(itemgetter(0), self.question_answer))
-        answer = list(map(itemgetter(1), self.question_answer))
-        corpus.append(input_text)
-        tfidf_vec = TfidfVectorizer(stop_words=stop_words)
-        tfidf = tfidf_vec.fit_transform(corpus)
-        similarity = cosine_similarity(tfidf[-1], tfidf)
-        idx = similarity.argsort()[0][-2]
-        return Response(answer[idx], similarity[0][idx])
+        return self.top_k(input_text, 1)[0]
+
+    def process_batch(self, input_texts: List[str], sessions: List[dict]) -> List[Optional[Response]]:
+        if self.index.document_count == 0:
+            return [None] * len(input_texts)
+        dense = self.dense
+        results = self.index.search_batch(input_texts, 1) if dense is None else dense.search_batch(
+            self.index, input_texts, 1)
+        return [Response(self.answers[result.ids[0]], min(max(float(result.scores[0]), 0.0), 1.0))
+                for result in results]
+
+    def top_k(self, input_text: str, k: int) -> List[Response]:
+        dense = self.dense
+        ids, similarity, scored = self.index.search(input_text, k) if dense is None else dense.search(
+            self.index, input_text, k)
+        module_logger.debug("Scored %d of %d corpus entries", scored, self.index.document_count)
+        # Rounding can put a perfect match a hair above 1.0, past the declared max_confidence, and dense cosines
+        # can be negative.
+        return [Response(self.answers[idx], min(max(float(score), 0.0), 1.0)) for idx, score in zip(ids, similarity)]
+
+    def static_responses(self) -> List[str]:
+        return list(dict.fromkeys(self.answers[idx] for idx in self._live_ids()))
+
+    def _live_ids(self) -> np.ndarray:
+        return np.flatnonzero(np.concatenate([np.zeros(0, np.uint64)] + self._pair_hashes))
+
+    def cache_key(self, input_text: str) -> Hashable:
+        # Questions with the same terms get the same query vector, whatever their order, case or stop words.
+        return tuple(sorted(Utterance.of(input_text).terms))
+
+    def cache_version(self) -> Hashable:
+        return self.index.generation, self._dense_fits
+
+
+def _pair_hash(pair: Tuple[str, str]) -> int:
+    """Stable across processes, unlike hash, and never 0, which marks a removed pair."""
+    digest = hashlib.blake2b('\0'.join(pair).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') | 1
+
+
+def read_pairs(path: str, question_field: str = 'question', answer_field: str = 'answer') -> Iterator[Tuple[str, str]]:
+    """
+    Question answer pairs of a file, read one line at a time: .csv files with a header naming both fields, other
+    files as JSON lines, each an object with both fields or a [question, answer] list.
+    """
+    with open(path, encoding='utf-8', newline='') as file:
+        if path.lower().endswith('.csv'):
+            for row in csv.DictReader(file):
+                yield row[question_field], row[answer_field]
+            return
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, list):
+                yield record[0], record[1]
+            else:
+                yield record[question_field], record[answer_field]
 
 
 class BinaryConvertRegexLogicAdapter(RegexLogicAdapter):
     pattern = re.compile(r'([01]{2,})', flags=re.IGNORECASE)
     keywords = ['binary', 'bin']
+    # Its confidence is calculate_confidence's.
+    max_confidence = 1.0
+    pure = True
 
     def __init__(self):
         super().__init__()
 
-    def process(self, input_text: str, session: dict) -> Response:
-        binary = self.pattern.findall(input_text)[0]
+    def process_matches(self, input_text: str, matches: List[re.Match], keywords: Set[str], session: dict) -> Response:
+        binary = match_value(matches[0])
         text = f'Decimal value of {binary} is {int(binary, 2)}'
-        conf = self.calculate_confidence(binary, input_text)
+        conf = self.calculate_confidence(binary, input_text, keywords)
         return Response(text, conf)
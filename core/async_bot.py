@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from core.logic import CoreBot, LogicAdapter, Ranked, Response, Stream
+from core.metrics import Metrics
+from core.sessions import SessionStore
+
+module_logger = logging.getLogger(__name__)
+
+
+class AsyncCoreBot(CoreBot):
+    """
+    CoreBot answering from an asyncio event loop.
+
+    Pre-processors still run one after another, they build the session, but logic adapters run concurrently:
+    coroutine adapters are awaited and synchronous ones go to an executor, the cpu_executor for adapters marked
+    cpu_bound. They are selected as by CoreBot.ask, with the same schedule, early exit and ranking, so both
+    give the same response. Output streams are fed through bounded queues and handled by one background task per stream, so
+    ask_async returns once the response is queued and only waits when a stream falls output_queue_size behind.
+    """
+
+    def __init__(self, session_store: SessionStore = None, executor: Executor = None, cpu_executor: Executor = None,
+                 output_queue_size: int = 8, metrics: Metrics = None, early_exit: bool = True) -> None:
+        super().__init__(session_store, early_exit=early_exit, metrics=metrics)
+        # Executors created here are shut down by aclose, those passed in belong to the caller.
+        self._own_executors: List[Executor] = []
+        if executor is None:
+            executor = ThreadPoolExecutor(thread_name_prefix='bot-io')
+            self._own_executors.append(executor)
+        if cpu_executor is None:
+            cpu_executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix='bot-cpu')
+            self._own_executors.append(cpu_executor)
+        self.executor = executor
+        self.cpu_executor = cpu_executor
+        self.output_queue_size = output_queue_size
+        self._output_queues: Dict[Stream, asyncio.Queue] = {}
+        self._output_tasks: List[asyncio.Task] = []
+
+    async def ask_async(self, input_text: str, session_id: Hashable = None) -> Optional[Response]:
+        input_text = self._utterance(input_text)
+        module_logger.info("Asked: %s", input_text)
+        session = self.session if session_id is None else self.session_store.get(session_id)
+
+        for processor in self.pre_processors:
+            if self.metrics is None:
+                await self._call(processor.process, input_text, session, cpu_bound=False)
+            else:
+                with self.metrics.timer('pre_processor', type(processor).__name__):
+                    await self._call(processor.process, input_text, session, cpu_bound=False)
+
+        best = await self._select_async(input_text, session)
+
+        if session_id is not None:
+            self.session_store.put(session_id, session)
+
+        if best is None:
+            return None
+
+        if self.metrics is not None:
+            self.metrics.count('wins', type(self.logic_adapters[best.index]).__name__)
+        module_logger.info("Best match: %s", best.response.response_text)
+        for adapter in self.output_adapters:
+            await self._output_queue(adapter).put(best.response)
+        return best.response
+
+    async def drain(self):
+        """Wait until every queued response was handled by its output stream."""
+        await asyncio.gather(*(queue.join() for queue in self._output_queues.values()))
+
+    async def aclose(self):
+        await self.drain()
+        for task in self._output_tasks:
+            task.cancel()
+        await asyncio.gather(*self._output_tasks, return_exceptions=True)
+        self._output_queues.clear()
+        self._output_tasks.clear()
+        # Nothing is running on them any more once drained, their threads exit without blocking the loop.
+        for executor in self._own_executors:
+            executor.shutdown(wait=False)
+        self._own_executors.clear()
+
+    async def _select_async(self, input_text: str, session: dict) -> Optional[Ranked]:
+        """
+        Fallback adapters are awaited first, they answer anything quickly and set the bar. The other adapters which
+        can still beat it then run at once, and their responses are ranked as they arrive until none of the ones
+        still running could win; those are counted as skipped and their responses dropped.
+        """
+        best: Optional[Ranked] = None
+        schedule = self._schedule()
+        for index, adapter in schedule:
+            if adapter.fallback:
+                response, elapsed = await self._timed_evaluate_async(adapter, input_text, session)
+                self._record_latency(adapter, elapsed, 1)
+                if response is not None:
+                    best = self._better(best, Ranked(response, index))
+
+        pending: Dict[asyncio.Task, Tuple[int, LogicAdapter]] = {}
+        for index, adapter in schedule:
+            if adapter.fallback:
+                continue
+            if not self._can_win(adapter, index, best):
+                self._skip(adapter)
+                continue
+            task = asyncio.create_task(self._timed_evaluate_async(adapter, input_text, session))
+            pending[task] = (index, adapter)
+
+        while pending and any(self._can_win(adapter, index, best) for index, adapter in pending.values()):
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # In schedule order, like CoreBot.respond, should several finish together.
+            for task in sorted(done, key=list(pending).index):
+                index, adapter = pending.pop(task)
+                response, elapsed = task.result()
+                self._record_latency(adapter, elapsed, 1)
+                if response is not None:
+                    best = self._better(best, Ranked(response, index))
+
+        for task, (index, adapter) in pending.items():
+            # Synchronous adapters keep their executor thread until they return, only the wait is cancelled.
+            task.cancel()
+            self._skip(adapter)
+        return best
+
+    async def _timed_evaluate_async(self, adapter: LogicAdapter, input_text: str,
+                                    session: dict) -> Tuple[Optional[Response], float]:
+        start = time.perf_counter()
+        response = await self._evaluate_async(adapter, input_text, session)
+        return response, time.perf_counter() - start
+
+    async def _evaluate_async(self, adapter: LogicAdapter, input_text: str, session: dict) -> Optional[Response]:
+        if asyncio.iscoroutinefunction(adapter.process):
+            if self.metrics is None:
+                return await self._evaluate_coroutine(adapter, input_text, session)
+            # Both halves at once, can_process may only be awaitable because process is.
+            self.metrics.count('calls', type(adapter).__name__)
+            with self.metrics.timer('process', type(adapter).__name__):
+                return await self._evaluate_coroutine(adapter, input_text, session)
+
+        evaluate = self._evaluate if self.metrics is None else self._evaluate_measured
+        if adapter.pure and self.response_cache_size:
+            response = await self._call(self._evaluate_cached, adapter, input_text, session, evaluate,
+                                        cpu_bound=adapter.cpu_bound)
+        else:
+            response = await self._call(evaluate, adapter, input_text, session, cpu_bound=adapter.cpu_bound)
+        if response is not None:
+            module_logger.debug("New Response: %s", response)
+        return response
+
+    @staticmethod
+    async def _evaluate_coroutine(adapter: LogicAdapter, input_text: str, session: dict) -> Optional[Response]:
+        can_process = adapter.can_process(input_text, session)
+        if inspect.isawaitable(can_process):
+            can_process = await can_process
+        return await adapter.process(input_text, session) if can_process else None
+
+    async def _call(self, function, *args, cpu_bound: bool):
+        executor = self.cpu_executor if cpu_bound else self.executor
+        return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+    def _output_queue(self, adapter: Stream) -> asyncio.Queue:
+        if adapter not in self._output_queues:
+            queue = asyncio.Queue(maxsize=self.output_queue_size)
+            self._output_queues[adapter] = queue
+            self._output_tasks.append(asyncio.create_task(self._handle_output(adapter, queue)))
+        return self._output_queues[adapter]
+
+    async def _handle_output(self, adapter: Stream, queue: asyncio.Queue):
+        while True:
+            response = await queue.get()
+            try:
+                start = time.perf_counter()
+                if asyncio.iscoroutinefunction(adapter.handle):
+                    await adapter.handle(response)
+                else:
+                    await self._call(adapter.handle, response, cpu_bound=False)
+                if self.metrics is not None:
+                    self.metrics.observe('output', type(adapter).__name__, time.perf_counter() - start)
+            except Exception:
+                if self.metrics is not None:
+                    self.metrics.count('errors', type(adapter).__name__)
+                module_logger.exception(f"Output stream {type(adapter).__name__} failed")
+            finally:
+                queue.task_done()
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import os
+import threading
+from typing import List, NamedTuple
+
+import numpy as np
+
+from core.index import SearchResult, TfidfIndex, _best
+
+
+class _DenseSnapshot(NamedTuple):
+    """Vectors of the documents folded in so far; fold_in publishes a new one, readers never lock."""
+    vectors: np.ndarray
+    scales: np.ndarray
+    alive: np.ndarray
+    generation: int
+
+
+class DenseIndex:
+    """
+    Low-rank view of a TfidfIndex: documents and queries projected on the top singular vectors of the TF-IDF
+    matrix, so questions sharing no term but used in similar contexts still score, and scored by cosine with one
+    matrix-vector product over a contiguous float32 matrix.
+
+    With quantize, document vectors are stored as int8 with a float32 scale per document, a quarter of the
+    memory, and dequantized block by block while scoring. Documents added to the TfidfIndex afterwards are
+    folded in, projected on the singular vectors fitted before; the vectors of older documents keep the idf
+    they were fitted with, and terms first seen after fitting are ignored, until the index is fitted again.
+    """
+
+    BLOCK_ROWS = 8192
+
+    def __init__(self, index: TfidfIndex, dimensions: int = 256, quantize: bool = False,
+                 max_training_rows: int = 200_000, seed: int = 0):
+        from sklearn.utils.extmath import randomized_svd
+
+        self.quantize = quantize
+        self._lock = threading.Lock()
+        rows = index.tfidf_rows()
+        training = rows
+        if rows.shape[0] > max_training_rows:
+            # The singular vectors of a sample span nearly the same space, at a fraction of the memory.
+            sample = np.random.default_rng(seed).choice(rows.shape[0], max_training_rows, replace=False)
+            training = rows[np.sort(sample)]
+        dimensions = max(1, min(dimensions, min(training.shape) - 1))
+        _, _, components = randomized_svd(training.astype(np.float32), dimensions, random_state=seed)
+        # Term-major, a query of a few terms sums a few contiguous rows.
+        self.components = np.ascontiguousarray(components.T, dtype=np.float32)
+        self._snapshot = _DenseSnapshot(np.zeros((0, dimensions), dtype=np.int8 if quantize else np.float32),
+                                        np.zeros(0, dtype=np.float32), np.zeros(0, dtype=bool), -1)
+        self.fold_in(index)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._snapshot.vectors
+
+    @property
+    def scales(self) -> np.ndarray:
+        return self._snapshot.scales
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._snapshot.alive
+
+    @property
+    def generation(self) -> int:
+        return self._snapshot.generation
+
+    @property
+    def dimensions(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        snapshot = self._snapshot
+        return self.components.nbytes + snapshot.vectors.nbytes + snapshot.scales.nbytes + snapshot.alive.nbytes
+
+    def fold_in(self, index: TfidfIndex):
+        """Project documents added since the last call and forget removed ones, a no-op when nothing changed."""
+        if index.generation == self._snapshot.generation:
+            return
+        with self._lock:
+            snapshot = self._snapshot
+            generation = index.generation
+            if generation == snapshot.generation:
+                return
+            rows = index.tfidf_rows(len(snapshot.vectors))
+            # Terms first seen after fitting have no singular vector.
+            rows = rows[:, :len(self.components)]
+            projected = [self._project(rows[block:block + self.BLOCK_ROWS])
+                         for block in range(0, rows.shape[0], self.BLOCK_ROWS)]
+            vectors, scales = snapshot.vectors, snapshot.scales
+            if projected:
+                blocks, block_scales = zip(*projected)
+                vectors = np.concatenate([vectors, *blocks])
+                scales = np.concatenate([scales, *block_scales])
+            self._snapshot = _DenseSnapshot(vectors, scales, index.alive[:len(vectors)], generation)
+
+    def _project(self, rows) -> tuple:
+        vectors = np.asarray(rows @ self.components, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        if not self.quantize:
+            return vectors, np.ones(len(vectors), dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127
+        quantized = np.round(np.divide(vectors, scales[:, None], out=np.zeros_like(vectors),
+                                       where=scales[:, None] > 0))
+        return quantized.astype(np.int8), scales.astype(np.float32)
+
+    def embed(self, index: TfidfIndex, text: str) -> np.ndarray:
+        terms, weights = index.query_vector(text)
+        known = terms < len(self.components)
+        vector = weights[known].astype(np.float32) @ self.components[terms[known]]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def scores(self, queries: np.ndarray, snapshot: _DenseSnapshot = None) -> np.ndarray:
+        """Cosine of every document with every query, queries as rows; removed documents score -1."""
+        vectors, scales, alive, _ = snapshot if snapshot is not None else self._snapshot
+        if not self.quantize:
+            scores = vectors @ queries.T
+        else:
+            scores = np.empty((len(vectors), len(queries)), dtype=np.float32)
+            for block in range(0, len(vectors), self.BLOCK_ROWS):
+                scores[block:block + self.BLOCK_ROWS] = \
+                    vectors[block:block + self.BLOCK_ROWS].astype(np.float32) @ queries.T
+            scores *= scales[:, None]
+        scores[~alive] = -1
+        return scores
+
+    def search(self, index: TfidfIndex, text: str, k: int) -> SearchResult:
+        return self.search_batch(index, [text], k)[0]
+
+    def search_batch(self, index: TfidfIndex, texts: List[str], k: int) -> List[SearchResult]:
+        self.fold_in(index)
+        snapshot = self._snapshot
+        alive = int(snapshot.alive.sum())
+        k = min(k, alive)
+        if k <= 0:
+            return [SearchResult(np.zeros(0, dtype=np.int64), np.zeros(0), 0) for _ in texts]
+        scores = self.scores(np.stack([self.embed(index, text) for text in texts]), snapshot)
+        ids = np.arange(len(snapshot.vectors))
+        return [SearchResult(*_best(ids, scores[:, column].astype(np.float64), k), alive)
+                for column in range(len(texts))]
+
+    def save(self, directory: str):
+        snapshot = self._snapshot
+        np.save(os.path.join(directory, 'dense_components.npy'), self.components)
+        for name in ('vectors', 'scales', 'alive'):
+            np.save(os.path.join(directory, f'dense_{name}.npy'), getattr(snapshot, name))
+
+    @classmethod
+    def load(cls, directory: str, index: TfidfIndex, mmap: bool = True) -> DenseIndex:
+        dense = cls.__new__(cls)
+        dense._lock = threading.Lock()
+        arrays = {name: np.load(os.path.join(directory, f'dense_{name}.npy'), mmap_mode='r' if mmap else None)
+                  for name in ('components', 'vectors', 'scales', 'alive')}
+        dense.components = arrays['components']
+        dense.quantize = arrays['vectors'].dtype == np.int8
+        # Saved together with the index, so up to date with it.
+        dense._snapshot = _DenseSnapshot(arrays['vectors'], arrays['scales'], arrays['alive'], index.generation)
+        return dense
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import bisect
+import json
+import os
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from core.string_table import StringTable
+
+
+def max_distance(entity: str) -> int:
+    """Edit distance tolerated for an entity, one typo per eight characters."""
+    return round(len(entity) / 8)
+
+
+def pieces(entity: str, distance: int) -> List[Tuple[str, int, int]]:
+    """
+    The entity cut into consecutive pieces of nearly equal length, with their offsets and the edits each is
+    searched with. An entity within distance edits of some text has a piece within one edit of its part of the text
+    when there are at least (distance + 1) / 2 pieces, and one verbatim when there is a single piece and no edit.
+    """
+    edits = min(distance, 1)
+    count = (distance + 2) // 2
+    bounds = [len(entity) * idx // count for idx in range(count + 1)]
+    return [(entity[begin:end], begin, edits) for begin, end in zip(bounds, bounds[1:])]
+
+
+def substring_within_distance(entity: str, text: str, limit: int, first_end: int, last_start: int) -> bool:
+    """
+    Whether some text[begin:end], with begin < first_end and end > last_start, is within limit edits of entity.
+    The last row of a semi-global Levenshtein table, starting anywhere before first_end being free, computed a
+    column at a time with Myers' bit-parallel algorithm: the entity's rows are the bits of a few integers.
+    """
+    if not entity:
+        return True
+    mask = (1 << len(entity)) - 1
+    last = 1 << (len(entity) - 1)
+    equal: Dict[str, int] = {}
+    for row, char in enumerate(entity):
+        equal[char] = equal.get(char, 0) | 1 << row
+    # Vertical deltas of the column, +1 (positive) or -1 (negative) per row, and the value of its last row.
+    positive, negative, score = mask, 0, len(entity)
+    for column, char in enumerate(text, 1):
+        eq = equal.get(char, 0)
+        vertical = eq | negative
+        horizontal = (((eq & positive) + positive) ^ positive) | eq
+        plus = negative | ~(horizontal | positive) & mask
+        minus = positive & horizontal
+        score += (plus & last != 0) - (minus & last != 0)
+        if column > last_start and score <= limit:
+            return True
+        # Starting after first_end costs an edit per character, the first row grows from there.
+        plus = (plus << 1 | (column >= first_end)) & mask
+        minus = minus << 1 & mask
+        positive = minus | ~(vertical | plus) & mask
+        negative = plus & vertical
+    return False
+
+
+# Keys are hashed as the polynomial sum of code point * _BASE ** position, modulo 2 ** 64, mixed with the length. A
+# deletion divides the part after it by _BASE, so the deletions of every substring are hashed with a few array ops.
+_BASE = 0x100000001B3
+_BASE_INVERSE = np.uint64(pow(_BASE, -1, 2 ** 64))
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_POWERS = np.array([pow(_BASE, position, 2 ** 64) for position in range(64)], dtype=np.uint64)
+
+_ARRAYS = ('hashes', 'starts', 'posting_entries', 'posting_offsets', 'posting_pieces', 'posting_cuts', 'entry_keys',
+           'distances', 'word_counts', 'key_lengths', 'deletion_lengths')
+
+
+def _powers(length: int) -> np.ndarray:
+    global _POWERS
+    if length > len(_POWERS):
+        _POWERS = np.array([pow(_BASE, position, 2 ** 64) for position in range(2 * length)], dtype=np.uint64)
+    return _POWERS[:length]
+
+
+def _mix(sums: np.ndarray, length: int) -> np.ndarray:
+    return (sums ^ np.uint64(length)) * _MIX
+
+
+def _hash_strings(strings: List[str]) -> np.ndarray:
+    """Hashes of the strings, those of one length at a time as rows of code points."""
+    hashes = np.zeros(len(strings), dtype=np.uint64)
+    by_length: Dict[int, List[int]] = {}
+    for idx, string in enumerate(strings):
+        by_length.setdefault(len(string), []).append(idx)
+    for length, indices in by_length.items():
+        codes = np.zeros((len(indices), length), dtype=np.uint64)
+        if length:
+            codes[:] = np.array([strings[idx] for idx in indices], dtype=f'<U{length}').view(np.uint32).reshape(
+                len(indices), length)
+        hashes[indices] = _mix((codes * _powers(length)).sum(axis=1), length)
+    return hashes
+
+
+class FuzzyGazetteer:
+    """
+    Finds entities approximately contained in a tokenised utterance, within max_distance edits.
+
+    Built once as a pigeonhole index: an entity allowed d edits is cut into (d + 2) // 2 pieces, so that an
+    approximate occurrence has a piece within one edit of its text, and every piece is indexed under itself and,
+    when it may have an edit, under each of its single character deletions. Two strings are one substitution apart
+    when they share the deletion at the same index, so a lookup probes the substrings of the utterance and their
+    deletions, of the lengths of the keys. Pieces are whole entities up to 11 characters and at least six long
+    otherwise, so keys are selective and the number of probes depends on the utterance, not on the gazetteer. An
+    entity hit by too few pieces, each one missed costing two edits and each hit with an edit one, is dropped; the
+    others are verified with a bit-parallel edit distance around where their hits say they begin, give or take d.
+
+    Keys are kept as sorted 64-bit hashes and the postings and entities as flat arrays and string tables, nothing
+    is a Python object per entity. save and load map them read-only, so processes loading one directory, or forked
+    from one holding the gazetteer, share its pages; lookups never write to them. A hash collision can only add a
+    candidate, which the edit distance then rejects.
+
+    Like a fuzzy substring search, an entity matches anywhere inside a token, and entities of several words are
+    matched against as many consecutive tokens joined by spaces.
+    """
+
+    def __init__(self, entities: Dict[str, List[str]] = None) -> None:
+        from nltk.tokenize import casual_tokenize
+        # Entity types, an entity's type is keys[entry_keys[entry]].
+        self.keys: List[str] = []
+        self.entities = StringTable()
+        self.normalised = StringTable()
+        entry_keys, distances, word_counts = [], [], []
+        # One posting per piece and deletion of a piece: the entry, offset of the piece in the entity, number of the
+        # piece and index of the deleted character, -1 for the piece itself.
+        strings, postings = [], []
+        key_lengths, deletion_lengths = set(), set()
+        for key, values in (entities or {}).items():
+            self.keys.append(key)
+            for entity in values:
+                words = casual_tokenize(entity.lower())
+                normalised = ' '.join(words)
+                distance = max_distance(entity)
+                entry = len(distances)
+                for number, (piece, offset, edits) in enumerate(pieces(normalised, distance)):
+                    keys = [(piece, -1)] + [(piece[:cut] + piece[cut + 1:], cut) for cut in range(len(piece) * edits)]
+                    for piece_key, cut in keys:
+                        strings.append(piece_key)
+                        postings.append((entry, offset, number, cut))
+                        key_lengths.add(len(piece_key))
+                    if edits:
+                        deletion_lengths.update((len(piece), len(piece) + 1))
+                self.entities.append(entity)
+                self.normalised.append(normalised)
+                entry_keys.append(len(self.keys) - 1)
+                distances.append(distance)
+                word_counts.append(len(words))
+
+        hashes = _hash_strings(strings)
+        order = np.argsort(hashes, kind='stable')
+        postings = np.array(postings, dtype=np.int64).reshape(-1, 4)[order]
+        self.hashes, first = np.unique(hashes[order], return_index=True)
+        self.starts = np.append(first, len(order)).astype(np.int64)
+        self.posting_entries = postings[:, 0].astype(np.int32)
+        self.posting_offsets = postings[:, 1].astype(np.int32)
+        self.posting_pieces = postings[:, 2].astype(np.int32)
+        self.posting_cuts = postings[:, 3].astype(np.int32)
+        self.entry_keys = np.array(entry_keys, dtype=np.int32)
+        self.distances = np.array(distances, dtype=np.int32)
+        self.word_counts = np.array(word_counts, dtype=np.int32)
+        self.key_lengths = np.array(sorted(key_lengths), dtype=np.int32)
+        self.deletion_lengths = np.array(sorted(deletion_lengths), dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.distances)
+
+    def entry(self, entry: int) -> Tuple[str, str, str, int, int]:
+        """(key, entity, normalised entity, allowed distance, number of words) of an entry, in gazetteer order."""
+        return (self.keys[self.entry_keys[entry]], self.entities[entry], self.normalised[entry],
+                int(self.distances[entry]), int(self.word_counts[entry]))
+
+    def save(self, directory: str):
+        """Arrays as .npy files, entity tables and types, for load to map them instead of building the index."""
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(directory, f'gazetteer_{name}.npy'), getattr(self, name))
+        self.entities.save(directory, 'gazetteer_entities')
+        self.normalised.save(directory, 'gazetteer_normalised')
+        with open(os.path.join(directory, 'gazetteer_keys.json'), 'w', encoding='utf-8') as file:
+            json.dump(self.keys, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> FuzzyGazetteer:
+        """Gazetteer written by save, its arrays memory mapped read-only by default."""
+        gazetteer = cls()
+        for name in _ARRAYS:
+            setattr(gazetteer, name, np.load(os.path.join(directory, f'gazetteer_{name}.npy'),
+                                             mmap_mode='r' if mmap else None))
+        gazetteer.entities = StringTable.load(directory, 'gazetteer_entities', mmap=mmap)
+        gazetteer.normalised = StringTable.load(directory, 'gazetteer_normalised', mmap=mmap)
+        with open(os.path.join(directory, 'gazetteer_keys.json'), encoding='utf-8') as file:
+            gazetteer.keys = json.load(file)
+        return gazetteer
+
+    def find(self, tokens: List[str]) -> List[Tuple[str, str]]:
+        """(key, entity) pairs found in the tokens, ordered by position and then by gazetteer order."""
+        tokens = [token.lower() for token in tokens]
+        text = ' '.join(tokens)
+        starts = [0]
+        for token in tokens[:-1]:
+            starts.append(starts[-1] + len(token) + 1)
+        ends = [start + len(token) for start, token in zip(starts, tokens)]
+
+        found = set()
+        for entry, first, last in self._candidates(text):
+            normalised, distance, words = self.normalised[entry], int(self.distances[entry]), int(
+                self.word_counts[entry])
+            low, high = first - distance, last + len(normalised) + distance
+            # Tokens the occurrences may overlap, the first one of a window being where they start.
+            for start in range(bisect.bisect_right(ends, low), len(tokens)):
+                if starts[start] >= high:
+                    break
+                for size in {1, words}:
+                    if start + size <= len(tokens) and (start, entry) not in found and self._matches(
+                            normalised, distance, words, first - starts[start], last - starts[start],
+                            text[starts[start]:ends[start + size - 1]], size, ends[start] - starts[start],
+                            starts[start + size - 1] - starts[start]):
+                        found.add((start, entry))
+        return [(self.keys[self.entry_keys[entry]], self.entities[entry]) for _, entry in sorted(found)]
+
+    def _probes(self, text: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Hashes of the substrings of the key lengths and of the deletions of those of the deletion lengths, with where
+        they begin in the text and the index of the deleted character, -1 for a substring itself.
+        """
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        hashes, begins, cuts = [], [], []
+        for length in np.union1d(self.key_lengths, self.deletion_lengths).tolist():
+            count = len(codes) - max(length, 1) + 1
+            if count <= 0:
+                break
+            weighted = sliding_window_view(codes, length)[:count] * _powers(length) if length else np.zeros((count, 0),
+                                                                                                          np.uint64)
+            sums = weighted.sum(axis=1)
+            if length in self.key_lengths:
+                hashes.append(_mix(sums, length))
+                begins.append(np.arange(count))
+                cuts.append(np.full(count, -1))
+            if length in self.deletion_lengths:
+                through = np.cumsum(weighted, axis=1)
+                before = through - weighted
+                # Characters after the deleted one move one position down.
+                deleted = before + (sums[:, None] - through) * _BASE_INVERSE
+                hashes.append(_mix(deleted.ravel(), length - 1))
+                begins.append(np.repeat(np.arange(count), length))
+                cuts.append(np.tile(np.arange(length), count))
+        if not hashes:
+            return np.zeros(0, np.uint64), np.zeros(0, np.int64), np.zeros(0, np.int64)
+        return np.concatenate(hashes), np.concatenate(begins), np.concatenate(cuts)
+
+    def _candidates(self, text: str) -> Iterable[Tuple[int, int, int]]:
+        """
+        Entries, in gazetteer order, with enough pieces within their edits of some substring, and the first and last
+        position in the text where the entity would begin according to those pieces.
+        """
+        hashes, begins, cuts = self._probes(text)
+        if len(self.hashes) == 0 or len(hashes) == 0:
+            return []
+        keys = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        hit = self.hashes[keys] == hashes
+        keys, begins, cuts = keys[hit], begins[hit], cuts[hit]
+        # Every posting of every key hit, next to the probe which hit it.
+        counts = self.starts[keys + 1] - self.starts[keys]
+        probe = np.repeat(np.arange(len(keys)), counts)
+        postings = self.starts[keys][probe] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        begins, cuts = begins[probe], cuts[probe]
+        posting_cuts = self.posting_cuts[postings]
+        # Strings sharing a deletion are one substitution apart only if it is at the same index.
+        valid = (cuts < 0) | (posting_cuts < 0) | (cuts == posting_cuts)
+        postings, begins, exact = postings[valid], begins[valid], ((cuts < 0) & (posting_cuts < 0))[valid]
+        if len(postings) == 0:
+            return []
+
+        entries = self.posting_entries[postings].astype(np.int64)
+        positions = begins - self.posting_offsets[postings]
+        pieces_hit = entries << 32 | self.posting_pieces[postings]
+        candidates, inverse = np.unique(entries, return_inverse=True)
+        first = np.full(len(candidates), np.iinfo(np.int64).max)
+        last = np.full(len(candidates), np.iinfo(np.int64).min)
+        np.minimum.at(first, inverse, positions)
+        np.maximum.at(last, inverse, positions)
+        hits = np.bincount(np.searchsorted(candidates, np.unique(pieces_hit) >> 32), minlength=len(candidates))
+        exact_hits = np.bincount(np.searchsorted(candidates, np.unique(pieces_hit[exact]) >> 32),
+                                 minlength=len(candidates))
+        # A piece not hit takes at least two edits, one hit only with an edit at least one.
+        distances = self.distances[candidates]
+        keep = 2 * ((distances + 2) // 2 - hits) + hits - exact_hits <= distances
+        return zip(candidates[keep].tolist(), first[keep].tolist(), last[keep].tolist())
+
+    @staticmethod
+    def _matches(normalised: str, distance: int, words: int, first: int, last: int, text: str, size: int,
+                 first_end: int, last_start: int) -> bool:
+        # Single tokens are searched for every entity, longer windows only for entities with as many words.
+        if size != 1 and size != words:
+            return False
+        low, high = max(0, first - distance), min(len(text), last + len(normalised) + distance)
+        if first_end <= low or high <= last_start or high - low < len(normalised) - distance:
+            return False
+        return substring_within_distance(normalised, text[low:high], distance, first_end - low,
+                                         max(0, last_start - low))
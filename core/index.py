@@ -0,0 +1,427 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from core.text import Utterance
+
+
+class _Snapshot:
+    """Immutable view of the index; writers publish a new one, readers never lock."""
+
+    def __init__(self, main: sparse.csr_matrix, main_squared: sparse.csr_matrix, delta: sparse.csr_matrix,
+                 alive: np.ndarray, df: np.ndarray, by_term: sparse.csc_matrix = None):
+        self.main = main
+        self.main_squared = main_squared
+        self.delta = delta
+        # Term-major copy of the main segment, reused by later snapshots for as long as the main segment lives.
+        self._by_term = by_term
+        self._postings = None
+        self.alive = alive
+        self.df = df
+        self.n_terms = len(df)
+        self.n_alive = int(alive.sum())
+        # Same weighting as TfidfVectorizer(smooth_idf=True), recomputed because every update moves the idf.
+        self.idf = np.log((1 + self.n_alive) / (1 + df)) + 1
+        self.unseen_idf = np.log(1 + self.n_alive) + 1
+        idf_squared = self.idf ** 2
+        self.norms = np.sqrt(np.concatenate([
+            main_squared @ idf_squared[:main.shape[1]],
+            _squared(delta) @ idf_squared[:delta.shape[1]],
+        ]))
+
+    def postings(self) -> Tuple[sparse.csc_matrix, np.ndarray]:
+        """Main segment by term, with the largest length-normalised count of every term."""
+        if self._postings is None:
+            if self._by_term is None:
+                self._by_term = self.main.tocsc()
+            by_term = self._by_term
+            normalised = by_term.data / self.norms[by_term.indices]
+            bound = np.zeros(by_term.shape[1])
+            non_empty = np.flatnonzero(np.diff(by_term.indptr))
+            if len(non_empty):
+                bound[non_empty] = np.maximum.reduceat(normalised, by_term.indptr[non_empty])
+            self._postings = by_term, bound
+        return self._postings
+
+    def dot(self, weights: np.ndarray) -> np.ndarray:
+        return np.concatenate([
+            self.main @ weights[:self.main.shape[1]],
+            self.delta @ weights[:self.delta.shape[1]],
+        ])
+
+
+class SearchResult(NamedTuple):
+    ids: np.ndarray
+    scores: np.ndarray
+    scored: int
+
+
+def _squared(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    return sparse.csr_matrix((matrix.data ** 2, matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def _widen(matrix: sparse.csr_matrix, n_terms: int) -> sparse.csr_matrix:
+    return sparse.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], n_terms))
+
+
+def _kth(scores: np.ndarray, k: int) -> float:
+    return np.partition(scores, len(scores) - k)[len(scores) - k] if len(scores) >= k else 0.0
+
+
+def _best(ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    best = np.argpartition(-scores, k - 1)[:k]
+    # Equal scores prefer the later document, like the argsort the adapter used to do.
+    best = np.flatnonzero(scores >= scores[best].min())
+    best = best[np.lexsort((-ids[best], -scores[best]))][:k]
+    return ids[best], scores[best]
+
+
+def _merge(main: sparse.csr_matrix, delta: sparse.csr_matrix, alive: np.ndarray,
+           n_terms: int) -> Tuple[sparse.csr_matrix, sparse.csr_matrix, sparse.csr_matrix]:
+    """Main segment with the delta appended, its squared counts and a new empty delta."""
+    main = sparse.vstack([_widen(main, n_terms), _widen(delta, n_terms)], format='csr')
+    # Removed documents are dropped from storage while merging, their ids stay as empty rows.
+    main = (sparse.diags(alive.astype(np.float64)) @ main).tocsr()
+    main.eliminate_zeros()
+    return main, _squared(main), _empty_rows(n_terms)
+
+
+def _empty_rows(n_terms: int) -> sparse.csr_matrix:
+    return sparse.csr_matrix((0, n_terms), dtype=np.float64)
+
+
+class TfidfIndex:
+    """
+    TF-IDF cosine index that accepts new and removed documents without refitting.
+
+    Raw term counts are kept in a large main segment plus a small append-only delta segment, and document
+    frequencies are updated in place, so the idf weights always match a full TfidfVectorizer refit over the
+    live documents. The delta is merged into the main segment once it grows past a fraction of it, which keeps
+    the cost of a merge amortised over the added rows. Removed documents keep their id and become empty rows.
+
+    Queries are not part of the fit. CorpusLogicAdapter used to refit with the query as one more document, which
+    moved the idf a little, so between close scores the best match can differ from that, for about 3% of queries
+    on a random corpus of 500 pairs.
+    """
+
+    def __init__(self, analyzer: Callable[[str], List[str]], documents: Iterable[str] = (),
+                 merge_ratio: float = 0.1, merge_min_rows: int = 1024, pruned: bool = False):
+        self.analyzer = analyzer
+        self.pruned = pruned
+        self.merge_ratio = merge_ratio
+        self.merge_min_rows = merge_min_rows
+        self.vocabulary: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Bumped by every change of the documents, results cached under an older generation are stale.
+        self.generation = 0
+        self._snapshot = _Snapshot(_empty_rows(0), _empty_rows(0), _empty_rows(0), np.zeros(0, dtype=bool), np.zeros(0))
+        self.add(documents)
+
+    def __len__(self) -> int:
+        return len(self._snapshot.alive)
+
+    @property
+    def document_count(self) -> int:
+        return self._snapshot.n_alive
+
+    def add(self, documents: Iterable[str]) -> range:
+        with self._lock:
+            snapshot = self._snapshot
+            rows = self._count_rows(documents)
+            n_terms = len(self.vocabulary)
+            df = np.zeros(n_terms)
+            df[:snapshot.n_terms] = snapshot.df
+            np.add.at(df, rows.indices, 1)
+
+            delta = sparse.vstack([_widen(snapshot.delta, n_terms), rows], format='csr')
+            alive = np.concatenate([snapshot.alive, np.ones(rows.shape[0], dtype=bool)])
+            self._publish(snapshot, delta, alive, df)
+            return range(len(snapshot.alive), len(alive))
+
+    def remove(self, ids: Iterable[int]):
+        with self._lock:
+            snapshot = self._snapshot
+            ids = np.unique(np.fromiter(ids, dtype=np.int64))
+            ids = ids[snapshot.alive[ids]]
+            if len(ids) == 0:
+                return
+
+            df = snapshot.df.copy()
+            for idx in ids:
+                np.subtract.at(df, self._row_terms(snapshot, idx), 1)
+            alive = snapshot.alive.copy()
+            alive[ids] = False
+            self._publish(snapshot, snapshot.delta, alive, df)
+
+    def save(self, directory: str):
+        """
+        Write the live documents as .npy arrays and the vocabulary as JSON, the delta merged into the main segment.
+        Ids are kept, removed documents stay empty rows.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            snapshot = self._snapshot
+            main, main_squared, _ = _merge(snapshot.main, snapshot.delta, snapshot.alive, snapshot.n_terms)
+            arrays = {'data': main.data, 'squared': main_squared.data, 'indices': main.indices,
+                      'indptr': main.indptr, 'alive': snapshot.alive, 'df': snapshot.df}
+            if self.pruned:
+                by_term = main.tocsc()
+                arrays.update(term_data=by_term.data, term_indices=by_term.indices, term_indptr=by_term.indptr)
+            terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+        with open(os.path.join(directory, 'vocabulary.json'), 'w', encoding='utf-8') as file:
+            json.dump(terms, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, analyzer: Callable[[str], List[str]], mmap: bool = True, **options) -> TfidfIndex:
+        """
+        Index written by save. The arrays are memory mapped read-only by default, so processes loading the same
+        directory share one copy in the page cache; documents added later go to the delta segment in memory.
+        """
+        mode = 'r' if mmap else None
+        names = ['data', 'squared', 'indices', 'indptr', 'alive', 'df']
+        if os.path.exists(os.path.join(directory, 'term_data.npy')):
+            names += ['term_data', 'term_indices', 'term_indptr']
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mode) for name in names}
+        with open(os.path.join(directory, 'vocabulary.json'), encoding='utf-8') as file:
+            terms = json.load(file)
+
+        index = cls(analyzer, **options)
+        index.vocabulary = {term: idx for idx, term in enumerate(terms)}
+        shape = (len(arrays['indptr']) - 1, len(arrays['df']))
+        main = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape, copy=False)
+        main_squared = sparse.csr_matrix((arrays['squared'], arrays['indices'], arrays['indptr']), shape=shape,
+                                         copy=False)
+        by_term = None
+        if index.pruned and 'term_data' in arrays:
+            by_term = sparse.csc_matrix((arrays['term_data'], arrays['term_indices'], arrays['term_indptr']),
+                                        shape=shape, copy=False)
+        index._snapshot = _Snapshot(main, main_squared, _empty_rows(shape[1]), arrays['alive'], arrays['df'], by_term)
+        index.generation += 1
+        return index
+
+    def similarity(self, text: str) -> np.ndarray:
+        """Cosine similarity of text against every document id, -1 for removed documents."""
+        snapshot = self._snapshot
+        return self._similarity(snapshot, *self._query(snapshot, text))
+
+    def _similarity(self, snapshot: _Snapshot, terms: np.ndarray, weights: np.ndarray, norm: float) -> np.ndarray:
+        similarity = np.zeros(len(snapshot.alive))
+        if norm > 0:
+            dense = np.zeros(snapshot.n_terms)
+            dense[terms] = weights
+            np.divide(snapshot.dot(dense), snapshot.norms * norm, out=similarity, where=snapshot.norms > 0)
+        similarity[~snapshot.alive] = -1
+        return similarity
+
+    def tfidf_rows(self, start: int = 0) -> sparse.csr_matrix:
+        """
+        L2-normalised TF-IDF rows of the documents from id start on, as a TfidfVectorizer fitted on the live
+        documents would transform them. Removed documents are empty rows.
+        """
+        snapshot = self._snapshot
+        n_terms, offset = snapshot.n_terms, snapshot.main.shape[0]
+        rows = sparse.vstack([_widen(snapshot.main, n_terms)[start:],
+                              _widen(snapshot.delta, n_terms)[max(0, start - offset):]], format='csr')
+        norms = snapshot.norms[start:]
+        scale = np.divide(snapshot.alive[start:], norms, out=np.zeros(len(norms)), where=norms > 0)
+        return (sparse.diags(scale) @ rows @ sparse.diags(snapshot.idf)).tocsr()
+
+    def query_vector(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Term ids and weights of the L2-normalised TF-IDF vector of a query, unknown terms left out."""
+        snapshot = self._snapshot
+        terms, weights, norm = self._query(snapshot, text)
+        if norm == 0:
+            return terms, weights
+        # Query weights are multiplied by the idf once more, for the dot product with raw counts.
+        return terms, weights / snapshot.idf[terms] / norm
+
+    @property
+    def alive(self) -> np.ndarray:
+        """Whether every id is a live document, removed ones being False."""
+        return self._snapshot.alive
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the count matrices and per document arrays, the vocabulary aside."""
+        snapshot = self._snapshot
+        matrices = [snapshot.main, snapshot.main_squared, snapshot.delta]
+        if snapshot._by_term is not None:
+            matrices.append(snapshot._by_term)
+        arrays = [array for matrix in matrices for array in (matrix.data, matrix.indices, matrix.indptr)]
+        arrays += [snapshot.alive, snapshot.norms, snapshot.df, snapshot.idf]
+        # The squared counts share their indices with the counts.
+        return sum({id(array): array.nbytes for array in arrays}.values())
+
+    def top_k(self, text: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.search(text, k)[:2]
+
+    def search(self, text: str, k: int) -> SearchResult:
+        snapshot = self._snapshot
+        k = min(k, snapshot.n_alive)
+        if k <= 0:
+            return SearchResult(np.zeros(0, dtype=np.int64), np.zeros(0), 0)
+        query = self._query(snapshot, text)
+        if not self.pruned:
+            similarity = self._similarity(snapshot, *query)
+            return SearchResult(*_best(np.arange(len(similarity)), similarity, k), snapshot.n_alive)
+
+        ids, scores, scored = self._prune(snapshot, *query, k)
+        return SearchResult(*self._finish(snapshot, ids, scores, k), scored)
+
+    def search_batch(self, texts: List[str], k: int) -> List[SearchResult]:
+        """Search many texts at once, exhaustive scoring becomes one sparse matrix product per segment."""
+        snapshot = self._snapshot
+        k = min(k, snapshot.n_alive)
+        if self.pruned or k <= 0:
+            return [self.search(text, k) for text in texts]
+
+        queries = [self._query(snapshot, text) for text in texts]
+        norms = np.array([norm for _, _, norm in queries])
+        matrix = sparse.csc_matrix(
+            (np.concatenate([weights for _, weights, _ in queries]), np.concatenate([terms for terms, _, _ in queries]),
+             np.cumsum([0] + [len(terms) for terms, _, _ in queries])),
+            shape=(snapshot.n_terms, len(queries)),
+        )
+        offset = snapshot.main.shape[0]
+        products = [
+            (snapshot.main @ matrix[:snapshot.main.shape[1]]).tocsc(),
+            (snapshot.delta @ matrix[:snapshot.delta.shape[1]]).tocsc(),
+        ]
+        results = []
+        for column, (terms, weights, norm) in enumerate(queries):
+            ids = np.concatenate([
+                product.indices[product.indptr[column]:product.indptr[column + 1]] + start
+                for product, start in zip(products, (0, offset))
+            ])
+            dot = np.concatenate([product.data[product.indptr[column]:product.indptr[column + 1]] for product in products])
+            keep = snapshot.alive[ids] & (snapshot.norms[ids] > 0) & (dot > 0)
+            ids, scores = ids[keep], dot[keep] / (snapshot.norms[ids[keep]] * norms[column])
+            scored = len(ids)
+            # Products sum in another order than the per-query path, near ties are rescored the same way.
+            ids = ids[scores >= _kth(scores, k) - 1e-9]
+            scores = self._rescore(snapshot, ids, terms, weights, norm)
+            results.append(SearchResult(*self._finish(snapshot, ids, scores, k), scored))
+        return results
+
+    def _finish(self, snapshot: _Snapshot, ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if len(ids) < k:
+            # Documents without a shared term score 0, exhaustive scoring would still rank them by id.
+            missing = np.setdiff1d(np.flatnonzero(snapshot.alive)[::-1][:k + len(ids)], ids)[::-1][:k - len(ids)]
+            ids, scores = np.concatenate([ids, missing]), np.concatenate([scores, np.zeros(len(missing))])
+        return _best(ids, scores, k)
+
+    @staticmethod
+    def _rescore(snapshot: _Snapshot, ids: np.ndarray, terms: np.ndarray, weights: np.ndarray, norm: float) -> np.ndarray:
+        """Score single documents exactly like the exhaustive matrix-vector product rounds them."""
+        dense = np.zeros(snapshot.n_terms)
+        dense[terms] = weights
+        offset = snapshot.main.shape[0]
+        in_main = ids < offset
+        dot = np.zeros(len(ids))
+        dot[in_main] = snapshot.main[ids[in_main]] @ dense[:snapshot.main.shape[1]]
+        dot[~in_main] = snapshot.delta[ids[~in_main] - offset] @ dense[:snapshot.delta.shape[1]]
+        return dot / (snapshot.norms[ids] * norm)
+
+    def _prune(self, snapshot: _Snapshot, terms: np.ndarray, weights: np.ndarray, norm: float,
+               k: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        if norm == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), 0
+        by_term, bound = snapshot.postings()
+        offset = snapshot.main.shape[0]
+        # The delta segment is small and scored in full, it seeds the top-k threshold.
+        delta_ids = np.arange(offset, len(snapshot.alive))
+        delta_ids = delta_ids[snapshot.alive[offset:] & (snapshot.norms[offset:] > 0)]
+        delta_scores = self._rescore(snapshot, delta_ids, terms, weights, norm)
+        delta_ids, delta_scores = delta_ids[delta_scores > 0], delta_scores[delta_scores > 0]
+
+        in_main = terms < by_term.shape[1]
+        terms, weights = terms[in_main], weights[in_main]
+        upper = bound[terms] * weights / norm
+        order = np.argsort(-upper, kind='stable')
+        terms, weights, remaining = terms[order], weights[order], np.cumsum(upper[order][::-1])[::-1]
+
+        ids, scores = np.zeros(0, dtype=np.int64), np.zeros(0)
+        threshold, scored = _kth(delta_scores, k), len(delta_ids)
+        for position, (term, weight) in enumerate(zip(terms, weights)):
+            start, end = by_term.indptr[term], by_term.indptr[term + 1]
+            rows = by_term.indices[start:end]
+            alive = snapshot.alive[rows]
+            rows = rows[alive]
+            contribution = by_term.data[start:end][alive] / snapshot.norms[rows] * (weight / norm)
+
+            if remaining[position] >= threshold - 1e-12:
+                merged, inverse = np.unique(np.concatenate([ids, rows]), return_inverse=True)
+                scored += len(merged) - len(ids)
+                ids, scores = merged, np.bincount(inverse, np.concatenate([scores, contribution]), len(merged))
+            else:
+                found = np.searchsorted(rows, ids)
+                hit = found < len(rows)
+                hit[hit] = rows[found[hit]] == ids[hit]
+                scores[hit] += contribution[found[hit]]
+
+            left = remaining[position + 1] if position + 1 < len(terms) else 0
+            threshold = _kth(np.concatenate([scores, delta_scores]), k)
+            hopeful = scores + left >= threshold - 1e-12
+            ids, scores = ids[hopeful], scores[hopeful]
+
+        # Survivors are rescored row by row, so ties round exactly like exhaustive scoring does.
+        scores = self._rescore(snapshot, ids, terms, weights, norm)
+        return np.concatenate([ids, delta_ids]), np.concatenate([scores, delta_scores]), scored
+
+    def _query(self, snapshot: _Snapshot, text: str) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Query terms with their weights against idf-weighted counts, and the query norm."""
+        if not isinstance(text, Utterance):
+            return self._weigh(snapshot, Counter(self.analyzer(text)))
+        # Term counts are shared by indexes with the same analyzer, the vector by lookups against the same snapshot.
+        counts = text.memo(self.analyzer, lambda: Counter(self.analyzer(text)))
+        return text.memo((id(self), snapshot), lambda: self._weigh(snapshot, counts))
+
+    def _weigh(self, snapshot: _Snapshot, counts: Counter) -> Tuple[np.ndarray, np.ndarray, float]:
+        terms, weights = [], []
+        norm = 0.0
+        for term, count in counts.items():
+            idx = self.vocabulary.get(term)
+            if idx is None or idx >= snapshot.n_terms or snapshot.df[idx] == 0:
+                # Unseen terms still weigh on the query norm, as they would if the query were fitted as well.
+                norm += (count * snapshot.unseen_idf) ** 2
+            else:
+                terms.append(idx)
+                weights.append(count * snapshot.idf[idx] ** 2)
+                norm += (count * snapshot.idf[idx]) ** 2
+        return np.array(terms, dtype=np.int64), np.array(weights), np.sqrt(norm)
+
+    def _count_rows(self, documents: Iterable[str]) -> sparse.csr_matrix:
+        indptr, indices, data = [0], [], []
+        for document in documents:
+            for term, count in Counter(self.analyzer(document)).items():
+                indices.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                data.append(count)
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr)),
+            shape=(len(indptr) - 1, len(self.vocabulary)),
+        )
+
+    @staticmethod
+    def _row_terms(snapshot: _Snapshot, idx: int) -> np.ndarray:
+        matrix = snapshot.main
+        if idx >= matrix.shape[0]:
+            matrix, idx = snapshot.delta, idx - matrix.shape[0]
+        return matrix.indices[matrix.indptr[idx]:matrix.indptr[idx + 1]]
+
+    def _publish(self, snapshot: _Snapshot, delta: sparse.csr_matrix, alive: np.ndarray, df: np.ndarray):
+        main, main_squared = snapshot.main, snapshot.main_squared
+        if delta.shape[0] > max(self.merge_min_rows, self.merge_ratio * main.shape[0]):
+            main, main_squared, delta = _merge(main, delta, alive, len(df))
+        by_term = snapshot._by_term if main is snapshot.main else None
+        self._snapshot = _Snapshot(main, main_squared, delta, alive, df, by_term)
+        self.generation += 1
@@ -2,26 +2,32 @@ from __future__ import annotations
 
 import logging
 import re
-import sys
+import threading
+import time
 from abc import ABC, abstractmethod, ABCMeta
-from typing import List
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Hashable, Dict, NamedTuple, Tuple, Set, Union
 
-import nltk.tokenize
-import numpy as np
-from fuzzysearch import find_near_matches
+from core.gazetteer import FuzzyGazetteer
+from core.metrics import Metrics
+from core.response_cache import MISSING, ResponseCache
+from core.sessions import SessionStore, InMemorySessionStore
+from core.text import PatternSet, Utterance
 
 module_logger = logging.getLogger(__name__)
 
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(logging.DEBUG)
-log_format = '%(levelname)5s - %(message)s'
-formatter = logging.Formatter(log_format)
-handler.setFormatter(formatter)
-module_logger.addHandler(handler)
-module_logger.propagate = False
-
 
 class LogicAdapter(ABC):
+    # Adapters spending their time on the CPU rather than waiting, AsyncCoreBot runs them on its cpu_executor.
+    cpu_bound: bool = False
+    # Expected milliseconds per utterance, CoreBot schedules by it until it has measured the adapter.
+    cost: float = 1.0
+    # Upper bound of Response.confidence, CoreBot skips the adapter once the best response reaches it.
+    max_confidence: float = float('inf')
+    # Output depends on cache_key(input_text) and cache_version() only, never on the session, so CoreBot may reuse it.
+    pure: bool = False
+    # Answers any input quickly, CoreBot runs it inline under a deadline so a response is ready when time runs out.
+    fallback: bool = False
 
     @abstractmethod
     def can_process(self, input_text, session: dict) -> bool:
@@ -31,6 +37,25 @@ class LogicAdapter(ABC):
     def process(self, input_text: str, session: dict) -> Response:
         pass
 
+    def process_batch(self, input_texts: List[str], sessions: List[dict]) -> List[Optional[Response]]:
+        """Responses for many utterances, None where the adapter can't process one. Override to vectorise."""
+        return [
+            self.process(input_text, session) if self.can_process(input_text, session) else None
+            for input_text, session in zip(input_texts, sessions)
+        ]
+
+    def static_responses(self) -> List[str]:
+        """Response texts known before any input, which output streams may prepare ahead of time."""
+        return []
+
+    def cache_key(self, input_text: str) -> Hashable:
+        """Normalised input of a pure adapter, inputs with equal keys get equal responses."""
+        return Utterance.of(input_text).lowered
+
+    def cache_version(self) -> Hashable:
+        """Changes whenever the data behind the responses changes, e.g. a corpus, making cached responses stale."""
+        return None
+
 
 class Stream(ABC):
 
@@ -38,8 +63,21 @@ class Stream(ABC):
     def handle(self, output: Response):
         pass
 
+    def prepare(self, output: Response):
+        """Hint that output may be handled soon, e.g. to synthesise its audio ahead of time."""
+        pass
+
 
 class RegexLogicAdapter(LogicAdapter, metaclass=ABCMeta):
+    # max_confidence stays unbounded, subclasses compute their own confidence and declare a bound only if they
+    # keep to it, e.g. by using calculate_confidence, which is at most 1.0.
+    cost = 0.05
+
+    def __init__(self) -> None:
+        super().__init__()
+        if type(self).process is RegexLogicAdapter.process and not hasattr(self, 'process_matches'):
+            raise TypeError(f"{type(self).__name__} must implement process or process_matches")
+
     @property
     @abstractmethod
     def pattern(self) -> re.Pattern:
@@ -51,27 +89,43 @@ class RegexLogicAdapter(LogicAdapter, metaclass=ABCMeta):
         pass
 
     def can_process(self, statement: str, session: dict):
-        return self.pattern.findall(statement)
+        return Utterance.of(statement).matches(self.pattern)
 
-    @abstractmethod
     def process(self, input_text: str, session: dict) -> Response:
-        pass
-
-    def calculate_confidence(self, match: str, input_statement: str) -> float:
+        """
+        Subclasses implement either this or process_matches(input_text, matches, keywords, session), which gets the
+        matches of the pattern and the lowercased words of the input, both computed once per utterance and shared
+        with can_process.
+        """
+        utterance = Utterance.of(input_text)
+        return self.process_matches(utterance, utterance.matches(self.pattern), utterance.words, session)
+
+    def calculate_confidence(self, match: str, input_statement: str, keywords: Set[str] = None) -> float:
         match_index = len(match) / len(input_statement)
-        keyword_index = self._contains_keyword(input_statement)
+        keyword_index = self._contains_keyword(input_statement, keywords)
         return match_index * 0.4 + keyword_index * 0.6
 
-    def _contains_keyword(self, input_statement: str):
-        return any(
-            keyword in [
-                word.lower()
-                for word in
-                input_statement.split()
-            ]
-            for keyword
-            in self.keywords
-        )
+    def _contains_keyword(self, input_statement: str, keywords: Set[str] = None):
+        if keywords is None:
+            keywords = Utterance.of(input_statement).words
+        return any(keyword in keywords for keyword in self.keywords)
+
+
+def match_value(match: re.Match):
+    """What findall reports for a match: the whole match, its only group or the tuple of its groups."""
+    groups = match.groups(default='')
+    if len(groups) == 0:
+        return match.group(0)
+    return groups[0] if len(groups) == 1 else groups
+
+
+def _merge_session(session: dict, submitted: dict, copy: dict):
+    """Apply to session what an adapter changed in its copy of the session as it was when submitted."""
+    for key, value in copy.items():
+        if key not in submitted or submitted[key] is not value:
+            session[key] = value
+    for key in submitted.keys() - copy.keys():
+        session.pop(key, None)
 
 
 class Response:
@@ -83,17 +137,46 @@ class Response:
         return f"{self.confidence:.2f}:{self.response_text[:32]}..."
 
 
+class Ranked(NamedTuple):
+    response: Response
+    # Registration index of the adapter which gave the response, it breaks confidence ties.
+    index: int
+
+
 class CoreBot:
 
-    def __init__(self) -> None:
+    def __init__(self, session_store: SessionStore = None, early_exit: bool = True, metrics: Metrics = None,
+                 response_cache_size: int = 1024, deadline_executor: Executor = None) -> None:
         super().__init__()
         self.logic_adapters: List[LogicAdapter] = []
+        # Patterns of the regex adapters, searched together before any of them scans on its own.
+        self._patterns = PatternSet()
         self.output_adapters: List[Stream] = []
         self.pre_processors: List[PreProcessorAdapter] = []
         self.session = {}
+        self.session_store: SessionStore = session_store if session_store is not None else InMemorySessionStore()
+        # Adapters are tried cheapest first and skipped once their max_confidence can't beat the best response.
+        self.early_exit = early_exit
+        self.adapter_latency: Dict[LogicAdapter, float] = {}
+        self.adapter_calls = 0
+        self.skipped_adapter_calls = 0
+        # Per stage latencies and per adapter counters, nothing is measured for them while it is None.
+        self.metrics: Optional[Metrics] = metrics
+        # Responses of pure adapters by their cache_key, at most response_cache_size per adapter, 0 disables them.
+        self.response_cache_size = response_cache_size
+        self.response_caches: Dict[LogicAdapter, ResponseCache] = {}
+        # Asks with a deadline_ms which an adapter did not finish in time, by adapter.
+        self.adapter_timeouts: Dict[LogicAdapter, int] = {}
+        self._deadline_executor: Optional[Executor] = deadline_executor
+        # Last future of every adapter submitted to the deadline_executor, one runs at a time per adapter.
+        self._deadline_futures: Dict[LogicAdapter, Future] = {}
+        self._deadline_lock = threading.Lock()
 
     def add_logic_adapters(self, logic_adapters: List[LogicAdapter]):
         self.logic_adapters.extend(logic_adapters)
+        self.clear_response_caches()
+        self._patterns = PatternSet(adapter.pattern for adapter in self.logic_adapters
+                                    if isinstance(adapter, RegexLogicAdapter))
 
     def add_output_adapters(self, stream_adapters: List[Stream]):
         self.output_adapters.extend(stream_adapters)
@@ -101,34 +184,332 @@ class CoreBot:
     def add_pre_processors(self, pre_processors: List[PreProcessorAdapter]):
         self.pre_processors.extend(pre_processors)
 
-    def ask(self, input_text: str):
+    def ask(self, input_text: str, session_id: Hashable = None, deadline_ms: float = None) -> Optional[Response]:
+        """
+        Without session_id the bot's own session is used, otherwise the conversation's one from the store.
+        Pre-processors and adapters all get the same Utterance, so its analyses are shared between them.
+
+        With deadline_ms, adapters run on the deadline_executor and the best response among those finished
+        deadline_ms after the call wins, see _evaluate_within.
+        """
+        started = time.perf_counter()
+        session = self.session if session_id is None else self.session_store.get(session_id)
+        response = self.respond(input_text, session, deadline_ms)
+        self.commit(response, session_id, session)
+        if self.metrics is not None:
+            self.metrics.observe('ask', 'CoreBot', time.perf_counter() - started)
+        return response
+
+    def respond(self, input_text: str, session: dict, deadline_ms: float = None) -> Optional[Response]:
+        """
+        Best response in the given session, which pre-processors update, without storing the session or feeding
+        output streams. ask is respond followed by commit; respond on a copy of a session answers speculatively.
+        """
+        metrics = self.metrics
+        started = time.perf_counter()
+        input_text = self._utterance(input_text)
         module_logger.info('\t\tBEGIN OF UTTERANCE')
-        module_logger.info(f"Asked: {input_text}")
-        available_responses = []
+        module_logger.info("Asked: %s", input_text)
+        best: Optional[Ranked] = None
 
         for processor in self.pre_processors:
-            processor.process(input_text, self.session)
-
-        module_logger.info("Session: " + str(self.session))
-
-        for adapter in self.logic_adapters:
-            if adapter.can_process(input_text, self.session):
-                response = adapter.process(input_text, self.session)
-                module_logger.debug(f"New Response: {response}")
-                available_responses.append(response)
+            if metrics is None:
+                processor.process(input_text, session)
+            else:
+                with metrics.timer('pre_processor', type(processor).__name__):
+                    processor.process(input_text, session)
+
+        module_logger.info("Session: %s", session)
+
+        evaluate = self._evaluate if metrics is None else self._evaluate_measured
+        selecting, evaluating = time.perf_counter(), 0.0
+        if deadline_ms is not None:
+            best = self._evaluate_within(input_text, session, evaluate, started + deadline_ms / 1000)
+        else:
+            for index, adapter in self._schedule():
+                if not self._can_win(adapter, index, best):
+                    self._skip(adapter)
+                    continue
+                response, elapsed = self._timed_evaluate(adapter, input_text, session, evaluate)
+                evaluating += elapsed
+                self._record_latency(adapter, elapsed, 1)
+                if response is not None:
+                    module_logger.debug("New Response: %s", response)
+                    best = self._better(best, Ranked(response, index))
+
+        if metrics is not None:
+            if deadline_ms is None:
+                # Scheduling, early exit and ranking, whatever the loop spent outside the adapters.
+                metrics.observe('selection', 'CoreBot', time.perf_counter() - selecting - evaluating)
+            if best is not None:
+                metrics.count('wins', type(self.logic_adapters[best.index]).__name__)
+        return best.response if best is not None else None
+
+    def commit(self, response: Optional[Response], session_id: Hashable, session: dict):
+        """Keep the session a response was given in as the conversation's one, and output the response."""
+        if session_id is not None:
+            self.session_store.put(session_id, session)
+        elif session is not self.session:
+            self.session.clear()
+            self.session.update(session)
+
+        if response is not None:
+            module_logger.info("Best match: %s", response.response_text)
+            self._output(response)
+            module_logger.info('\t\tEND OF UTTERANCE\n')
+
+    def ask_batch(self, input_texts: List[str], sessions: List[dict] = None) -> List[Optional[Response]]:
+        """
+        Answer many utterances at once, each adapter gets the whole batch through process_batch.
+        Without sessions every utterance starts from its own empty session, as if asked in a fresh conversation.
+        Returns the best response of every utterance in input order, None where no adapter could process it.
+        """
+        input_texts = [self._utterance(input_text) for input_text in input_texts]
+        if sessions is None:
+            sessions = [{} for _ in input_texts]
+        module_logger.info("Asked batch of %d", len(input_texts))
+        metrics = self.metrics
 
-        if len(available_responses) == 0:
-            return ""
-
-        match = np.array([res.confidence for res in available_responses]).argsort()[-1]
-        module_logger.info(f"Best match: {available_responses[match].response_text}")
+        for processor in self.pre_processors:
+            if metrics is None:
+                processor.process_batch(input_texts, sessions)
+            else:
+                with metrics.timer('pre_processor', type(processor).__name__):
+                    processor.process_batch(input_texts, sessions)
+
+        best: List[Optional[Ranked]] = [None] * len(input_texts)
+        for index, adapter in self._schedule():
+            pending = [item for item in range(len(input_texts)) if self._can_win(adapter, index, best[item])]
+            self.skipped_adapter_calls += len(input_texts) - len(pending)
+            if metrics is not None and len(pending) < len(input_texts):
+                metrics.count('skipped', type(adapter).__name__, len(input_texts) - len(pending))
+            if not pending:
+                continue
+            start = time.perf_counter()
+            batch = [input_texts[item] for item in pending], [sessions[item] for item in pending]
+            if adapter.pure and self.response_cache_size:
+                responses = self._process_batch_cached(adapter, *batch)
+            else:
+                responses = self._process_batch(adapter, *batch)
+            self._record_latency(adapter, time.perf_counter() - start, len(pending))
+            for item, response in zip(pending, responses):
+                if response is not None:
+                    best[item] = self._better(best[item], Ranked(response, index))
+
+        responses = [ranked.response if ranked is not None else None for ranked in best]
+        for ranked in best:
+            if ranked is not None:
+                if metrics is not None:
+                    metrics.count('wins', type(self.logic_adapters[ranked.index]).__name__)
+                self._output(ranked.response)
+        return responses
+
+    def _evaluate_within(self, input_text: str, session: dict, evaluate: Callable[[LogicAdapter, str, dict],
+                         Optional[Response]], deadline: float) -> Optional[Ranked]:
+        """
+        Fallback adapters run first in the calling thread, so there is an answer whatever happens; the others are
+        submitted to the deadline_executor at once and collected until the deadline, or until none of the pending
+        ones could beat the best response. Adapters still running then are counted in adapter_timeouts and their
+        responses dropped; a thread can't be interrupted, so a stuck adapter keeps its worker until it returns.
+        An adapter whose previous call hasn't returned yet isn't submitted again but counted as timed out at once,
+        so a stuck adapter holds one worker rather than all of them. Submitted adapters get a shallow copy of the
+        session, which may outlive the ask; what the ones returning in time write into it is merged back into the
+        session as they return, what the ones timed out write is dropped.
+        """
+        best: Optional[Ranked] = None
+        # Adapters submitted, with their index, the session as submitted and the copy they were given.
+        pending: Dict[Future, Tuple[int, LogicAdapter, dict, dict]] = {}
+        busy: List[LogicAdapter] = []
+        for index, adapter in self._schedule():
+            if adapter.fallback:
+                response, elapsed = self._timed_evaluate(adapter, input_text, session, evaluate)
+                self._record_latency(adapter, elapsed, 1)
+                if response is not None:
+                    best = self._better(best, Ranked(response, index))
+                continue
+            with self._deadline_lock:
+                previous = self._deadline_futures.get(adapter)
+                if previous is not None and not previous.done():
+                    busy.append(adapter)
+                    continue
+                copy = dict(session)
+                future = self.deadline_executor.submit(self._timed_evaluate, adapter, input_text, copy, evaluate)
+                self._deadline_futures[adapter] = future
+            pending[future] = (index, adapter, dict(session), copy)
+        for adapter in busy:
+            self._timeout(adapter)
+
+        while pending:
+            if self.early_exit and not any(self._can_win(adapter, index, best) for index, adapter, _, _ in
+                                           pending.values()):
+                break
+            done, _ = wait(pending, timeout=max(0.0, deadline - time.perf_counter()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                index, adapter, submitted, copy = pending.pop(future)
+                response, elapsed = future.result()
+                self._record_latency(adapter, elapsed, 1)
+                _merge_session(session, submitted, copy)
+                if response is not None:
+                    module_logger.debug("New Response: %s", response)
+                    best = self._better(best, Ranked(response, index))
+
+        for future, (index, adapter, _, _) in pending.items():
+            future.cancel()
+            if not self._can_win(adapter, index, best):
+                # Left behind by the early exit rather than the deadline.
+                self._skip(adapter)
+                continue
+            self._timeout(adapter)
+        return best
+
+    def _timeout(self, adapter: LogicAdapter):
+        self.adapter_timeouts[adapter] = self.adapter_timeouts.get(adapter, 0) + 1
+        module_logger.warning("%s missed the deadline", type(adapter).__name__)
+        if self.metrics is not None:
+            self.metrics.count('timeouts', type(adapter).__name__)
+
+    def _timed_evaluate(self, adapter: LogicAdapter, input_text: str, session: dict,
+                        evaluate: Callable[[LogicAdapter, str, dict], Optional[Response]]) -> Tuple[
+            Optional[Response], float]:
+        start = time.perf_counter()
+        if adapter.pure and self.response_cache_size:
+            response = self._evaluate_cached(adapter, input_text, session, evaluate)
+        else:
+            response = evaluate(adapter, input_text, session)
+        return response, time.perf_counter() - start
+
+    def _skip(self, adapter: LogicAdapter):
+        self.skipped_adapter_calls += 1
+        if self.metrics is not None:
+            self.metrics.count('skipped', type(adapter).__name__)
 
+    @property
+    def deadline_executor(self) -> Executor:
+        """Runs adapters of asks with a deadline, created on the first one."""
+        if self._deadline_executor is None:
+            self._deadline_executor = ThreadPoolExecutor(thread_name_prefix='bot-deadline')
+        return self._deadline_executor
+
+    @staticmethod
+    def _evaluate(adapter: LogicAdapter, input_text: str, session: dict) -> Optional[Response]:
+        return adapter.process(input_text, session) if adapter.can_process(input_text, session) else None
+
+    def _evaluate_measured(self, adapter: LogicAdapter, input_text: str, session: dict) -> Optional[Response]:
+        """_evaluate timing can_process and process apart, and counting calls and errors of the adapter."""
+        name = type(adapter).__name__
+        self.metrics.count('calls', name)
+        with self.metrics.timer('can_process', name):
+            can_process = adapter.can_process(input_text, session)
+        if not can_process:
+            return None
+        with self.metrics.timer('process', name):
+            return adapter.process(input_text, session)
+
+    def _evaluate_cached(self, adapter: LogicAdapter, input_text: str, session: dict,
+                         evaluate: Callable[[LogicAdapter, str, dict], Optional[Response]]) -> Optional[Response]:
+        cache = self._response_cache(adapter)
+        key, version = adapter.cache_key(input_text), adapter.cache_version()
+        response = cache.get(key, version)
+        if self.metrics is not None:
+            self.metrics.count('cache_hits' if response is not MISSING else 'cache_misses', type(adapter).__name__)
+        if response is MISSING:
+            response = evaluate(adapter, input_text, session)
+            cache.put(key, version, response)
+        return response
+
+    def _process_batch(self, adapter: LogicAdapter, input_texts: List[str],
+                       sessions: List[dict]) -> List[Optional[Response]]:
+        if self.metrics is None:
+            return adapter.process_batch(input_texts, sessions)
+        self.metrics.count('calls', type(adapter).__name__, len(input_texts))
+        with self.metrics.timer('process_batch', type(adapter).__name__):
+            return adapter.process_batch(input_texts, sessions)
+
+    def _process_batch_cached(self, adapter: LogicAdapter, input_texts: List[str],
+                              sessions: List[dict]) -> List[Optional[Response]]:
+        """process_batch of the utterances missing from the adapter's response cache only."""
+        cache = self._response_cache(adapter)
+        version = adapter.cache_version()
+        keys = [adapter.cache_key(input_text) for input_text in input_texts]
+        responses = [cache.get(key, version) for key in keys]
+        missed = [item for item, response in enumerate(responses) if response is MISSING]
+        if self.metrics is not None:
+            self.metrics.count('cache_hits', type(adapter).__name__, len(input_texts) - len(missed))
+            self.metrics.count('cache_misses', type(adapter).__name__, len(missed))
+        if missed:
+            computed = self._process_batch(adapter, [input_texts[item] for item in missed],
+                                           [sessions[item] for item in missed])
+            for item, response in zip(missed, computed):
+                responses[item] = response
+                cache.put(keys[item], version, response)
+        return responses
+
+    def _response_cache(self, adapter: LogicAdapter) -> ResponseCache:
+        cache = self.response_caches.get(adapter)
+        if cache is None:
+            cache = self.response_caches.setdefault(adapter, ResponseCache(self.response_cache_size))
+        return cache
+
+    def clear_response_caches(self):
+        for cache in self.response_caches.values():
+            cache.clear()
+
+    def response_cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """Hit rates and sizes of the response caches, by adapter class name."""
+        return {type(adapter).__name__: cache.stats() for adapter, cache in self.response_caches.items()}
+
+    def _utterance(self, input_text: str) -> Utterance:
+        utterance = Utterance.of(input_text)
+        self._patterns.prime(utterance)
+        return utterance
+
+    def _output(self, response: Response):
         for adapter in self.output_adapters:
-            adapter.handle(available_responses[match])
-        module_logger.info('\t\tEND OF UTTERANCE\n')
+            if self.metrics is None:
+                adapter.handle(response)
+            else:
+                with self.metrics.timer('output', type(adapter).__name__):
+                    adapter.handle(response)
+
+    @staticmethod
+    def _better(best: Optional[Ranked], candidate: Ranked) -> Ranked:
+        if best is None or (candidate.response.confidence, candidate.index) > (best.response.confidence, best.index):
+            return candidate
+        return best
+
+    def _schedule(self) -> List[Tuple[int, LogicAdapter]]:
+        """Adapters with their registration index, the ones expected to be cheapest first."""
+        if not self.early_exit:
+            return list(enumerate(self.logic_adapters))
+        return sorted(enumerate(self.logic_adapters), key=lambda item: self.adapter_latency.get(item[1], item[1].cost))
+
+    def _can_win(self, adapter: LogicAdapter, index: int, best: Optional[Ranked]) -> bool:
+        if not self.early_exit or best is None:
+            return True
+        return (adapter.max_confidence, index) > (best.response.confidence, best.index)
+
+    def _record_latency(self, adapter: LogicAdapter, seconds: float, calls: int):
+        self.adapter_calls += calls
+        milliseconds = seconds * 1000 / calls
+        previous = self.adapter_latency.get(adapter)
+        self.adapter_latency[adapter] = milliseconds if previous is None else 0.8 * previous + 0.2 * milliseconds
+
+    def static_responses(self) -> List[str]:
+        """
+        Static responses of all logic adapters, without duplicates, most likely to be needed first: those of
+        fallback adapters, which answer whatever the input, then the others in registration order.
+        """
+        adapters = sorted(self.logic_adapters, key=lambda adapter: not adapter.fallback)
+        return list(dict.fromkeys(text for adapter in adapters for text in adapter.static_responses()))
 
     def clean_sessions(self):
         self.session = {}
+        self.session_store.clear()
+
+    def clean_session(self, session_id: Hashable):
+        self.session_store.discard(session_id)
 
 
 class PreProcessorAdapter(ABC):
@@ -142,16 +523,32 @@ class PreProcessorAdapter(ABC):
     def process(self, input_text: str, session: dict):
         pass
 
+    def process_batch(self, input_texts: List[str], sessions: List[dict]):
+        for input_text, session in zip(input_texts, sessions):
+            self.process(input_text, session)
+
 
 class EntityExtractorAdapter(PreProcessorAdapter):
     keywords = {}
 
-    def __init__(self, entities: dict):
-        self.keywords = entities
+    def __init__(self, entities: Union[dict, FuzzyGazetteer]):
+        """
+        entities maps entity types to their names, or is a gazetteer already built, e.g. loaded memory mapped, so
+        that server workers share one copy of it.
+        """
+        if isinstance(entities, FuzzyGazetteer):
+            self.gazetteer = entities
+        else:
+            self.keywords = entities
+            self.gazetteer = FuzzyGazetteer(entities)
+
+    def save(self, directory: str):
+        self.gazetteer.save(directory)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> EntityExtractorAdapter:
+        return cls(FuzzyGazetteer.load(directory, mmap=mmap))
 
     def process(self, input_text: str, session: dict):
-        for token in nltk.tokenize.casual_tokenize(input_text):
-            for key, entities in self.keywords.items():
-                for entity in entities:
-                    if len(find_near_matches(entity.lower(), token.lower(), max_l_dist=round(len(entity) / 8))) > 0:
-                        session[key] = entity
+        for key, entity in self.gazetteer.find(Utterance.of(input_text).tokens):
+            session[key] = entity
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Upper bounds in seconds, from 10 microseconds (a regex adapter) to 10 seconds (a model loading on first use).
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class Histogram:
+    """Latencies counted in fixed buckets, so observing is a bisect and memory does not grow with calls."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative(self) -> List[int]:
+        total, cumulative = 0, []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q quantile, an overestimate of at most one bucket."""
+        if self.count == 0:
+            return 0.0
+        for bound, total in zip(self.buckets, self.cumulative()):
+            if total >= q * self.count:
+                return bound
+        return self.buckets[-1]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum_seconds': self.sum,
+            'mean_ms': self.sum * 1000 / self.count if self.count else 0.0,
+            'p50_ms': self.quantile(0.5) * 1000,
+            'p99_ms': self.quantile(0.99) * 1000,
+            'buckets': {_bound(bound): total for bound, total in zip(self.buckets, self.cumulative())},
+        }
+
+
+class Metrics:
+    """
+    Latency histograms per stage and component, and counters per component, shared by the bots given it.
+
+    Stages are 'ask', 'pre_processor', 'can_process', 'process', 'process_batch', 'selection' and 'output';
+    components are adapter class names. Counters are 'calls', 'skipped', 'wins' and 'errors'. A bot without
+    Metrics measures nothing beyond what its scheduling already needs.
+    """
+
+    def __init__(self, prefix: str = 'corebot', buckets: Tuple[float, ...] = BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get((stage, name))
+            if histogram is None:
+                histogram = self.histograms[(stage, name)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def count(self, counter: str, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[counter][name] += amount
+
+    def timer(self, stage: str, name: str) -> Timer:
+        """Context manager observing the time spent in its body, an exception raised in it counts as an error."""
+        return Timer(self, stage, name)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stages: Dict[str, Dict[str, Any]] = defaultdict(dict)
+            for (stage, name), histogram in sorted(self.histograms.items()):
+                stages[stage][name] = histogram.as_dict()
+            return {'stages': dict(stages),
+                    'counters': {counter: dict(values) for counter, values in sorted(self.counters.items())}}
+
+    def prometheus(self) -> str:
+        """Snapshot in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            seconds = f'{self.prefix}_stage_seconds'
+            if self.histograms:
+                lines.append(f'# HELP {seconds} Time spent per stage and component.')
+                lines.append(f'# TYPE {seconds} histogram')
+            for (stage, name), histogram in sorted(self.histograms.items()):
+                labels = f'stage="{_escape(stage)}",name="{_escape(name)}"'
+                for bound, total in zip(histogram.buckets, histogram.cumulative()):
+                    lines.append(f'{seconds}_bucket{{{labels},le="{_bound(bound)}"}} {total}')
+                lines.append(f'{seconds}_sum{{{labels}}} {histogram.sum!r}')
+                lines.append(f'{seconds}_count{{{labels}}} {histogram.count}')
+            for counter, values in sorted(self.counters.items()):
+                metric = f'{self.prefix}_{counter}_total'
+                lines.append(f'# TYPE {metric} counter')
+                for name, value in sorted(values.items()):
+                    lines.append(f'{metric}{{name="{_escape(name)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class Timer:
+    __slots__ = ('metrics', 'stage', 'name', 'start')
+
+    def __init__(self, metrics: Metrics, stage: str, name: str):
+        self.metrics = metrics
+        self.stage = stage
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> Timer:
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> Optional[bool]:
+        self.metrics.observe(self.stage, self.name, time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.metrics.count('errors', self.name)
+        return None
+
+
+def _bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
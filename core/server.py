@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from core.logic import CoreBot
+from core.sessions import SharedSessionStore
+
+module_logger = logging.getLogger(__name__)
+
+
+class BotServer:
+    """
+    Pre-forking CoreBot server on a Unix socket, speaking one JSON object per line.
+
+    The bot is built once in the parent, frozen out of the garbage collector's reach and shared with the forked
+    worker processes. Pages stay shared only while nothing writes to them, and reading a Python object writes its
+    reference count, so what workers share are arrays: the corpus matrices and packed answers of a
+    CorpusLogicAdapter and the index of an EntityExtractorAdapter's FuzzyGazetteer, best loaded memory mapped with
+    their load methods so that they are pages of the page cache. Worker memory then stays flat as workers are
+    added, bots holding large dicts or lists of Python objects copy them into every worker. Every worker accepts connections from the shared listening socket and serves one connection at a
+    time, a connection is one conversation unless requests name their own session_id.
+
+    The bot's session store is moved into a manager process shared by all workers, see SharedSessionStore: a
+    session_id continued on a new connection finds its session whichever worker accepts it, at the cost of a round
+    trip to the manager to load and to store the session of every request.
+
+        request:  {"text": "Who are you", "session_id": "optional"}
+        response: {"response": "I am ...", "confidence": 0.93} or {"error": "..."}
+    """
+
+    def __init__(self, bot_factory: Callable[[], CoreBot], socket_path: str, workers: int = None,
+                 backlog: int = 128):
+        self.bot_factory = bot_factory
+        self.socket_path = socket_path
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.backlog = backlog
+        self.processes: List[multiprocessing.Process] = []
+        self._listener: Optional[socket.socket] = None
+        self._bot: Optional[CoreBot] = None
+        self._sessions: Optional[SharedSessionStore] = None
+        self._stopping = False
+
+    def start(self):
+        """Build the bot, bind the socket and fork the workers, returns once they are running."""
+        self._bot = self.bot_factory()
+        self._sessions = self._bot.session_store = SharedSessionStore(self._bot.session_store)
+        # Everything built so far lives as long as the server, the collector would only dirty shared pages.
+        gc.collect()
+        gc.freeze()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        self._listener.listen(self.backlog)
+        self._stopping = False
+        self.processes = [self._fork() for _ in range(self.workers)]
+        module_logger.info("Serving on %s with %d workers", self.socket_path, self.workers)
+
+    def serve_forever(self):
+        """start, then restart workers which die until SIGTERM or SIGINT."""
+        self.start()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: self._request_stop())
+        try:
+            while not self._stopping:
+                for position, process in enumerate(self.processes):
+                    process.join(timeout=1.0 / len(self.processes))
+                    if not process.is_alive() and not self._stopping:
+                        module_logger.warning("Worker %d exited with %s, restarting", process.pid, process.exitcode)
+                        self.processes[position] = self._fork()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopping = True
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        if self._sessions is not None:
+            self._sessions.shutdown()
+            self._sessions = None
+        gc.unfreeze()
+
+    def _request_stop(self):
+        self._stopping = True
+
+    def _fork(self) -> multiprocessing.Process:
+        process = multiprocessing.get_context('fork').Process(target=self._work, daemon=True)
+        process.start()
+        return process
+
+    def _work(self):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        connections = 0
+        while True:
+            connection, _ = self._listener.accept()
+            connections += 1
+            with connection:
+                self._converse(connection, f'{os.getpid()}:{connections}')
+
+    def _converse(self, connection: socket.socket, conversation: Hashable):
+        bot = self._bot
+        with connection.makefile('rb') as reader, connection.makefile('wb') as writer:
+            try:
+                for line in reader:
+                    writer.write(json.dumps(self._answer(bot, line, conversation)).encode('utf-8') + b'\n')
+                    writer.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        bot.clean_session(conversation)
+
+    @staticmethod
+    def _answer(bot: CoreBot, line: bytes, conversation: Hashable) -> Dict[str, Any]:
+        try:
+            request = json.loads(line)
+            text, session_id = str(request['text']), request.get('session_id', conversation)
+            hash(session_id)
+        except (ValueError, KeyError, TypeError) as error:
+            return {'error': f'bad request: {error!r}'}
+        try:
+            response = bot.ask(text, session_id=session_id)
+        except Exception as error:
+            module_logger.exception("ask failed")
+            return {'error': repr(error)}
+        if response is None:
+            return {'response': None, 'confidence': None}
+        return {'response': response.response_text, 'confidence': response.confidence}
+
+
+class BotClient:
+    """One connection, one conversation, to a BotServer."""
+
+    def __init__(self, socket_path: str):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(socket_path)
+        self._reader = self.connection.makefile('rb')
+        self._writer = self.connection.makefile('wb')
+
+    def ask(self, text: str, session_id: Hashable = None) -> Dict[str, Any]:
+        request = {'text': text} if session_id is None else {'text': text, 'session_id': session_id}
+        self._writer.write(json.dumps(request).encode('utf-8') + b'\n')
+        self._writer.flush()
+        return json.loads(self._reader.readline())
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()
+        self.connection.close()
+
+    def __enter__(self) -> BotClient:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
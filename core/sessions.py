@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import copy
+import multiprocessing
+import pickle
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SessionStore(ABC):
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @abstractmethod
+    def get(self, session_id: Hashable) -> dict:
+        """Session of the conversation, a new empty one when it is unknown or expired."""
+        pass
+
+    @abstractmethod
+    def peek(self, session_id: Hashable) -> dict:
+        """A copy of the session as get would return it, without counting a lookup or refreshing its last use."""
+        pass
+
+    @abstractmethod
+    def put(self, session_id: Hashable, session: dict):
+        pass
+
+    @abstractmethod
+    def discard(self, session_id: Hashable):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {'sessions': len(self), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Sessions kept in least recently used order, bounded by max_sessions and optionally by an idle time to live.
+    Expired sessions are dropped lazily, from the least recently used end, whenever the store is touched.
+    """
+
+    def __init__(self, max_sessions: int = 10_000, idle_ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+        self._sessions: OrderedDict[Hashable, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Hashable) -> dict:
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return {}
+            self.hits += 1
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            return self._load(entry[1])
+
+    def peek(self, session_id: Hashable) -> dict:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or self.idle_ttl is not None and self.clock() - entry[0] >= self.idle_ttl:
+                return {}
+            return copy.deepcopy(self._load(entry[1]))
+
+    def put(self, session_id: Hashable, session: dict):
+        with self._lock:
+            now = self.clock()
+            self._sessions[session_id] = (now, self._dump(session))
+            self._sessions.move_to_end(session_id)
+            self._expire(now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, session_id: Hashable):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expire(self, now: float):
+        if self.idle_ttl is None:
+            return
+        while self._sessions:
+            session_id, (last_seen, _) = next(iter(self._sessions.items()))
+            if now - last_seen < self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    @staticmethod
+    def _dump(session: dict) -> Any:
+        return session
+
+    @staticmethod
+    def _load(value: Any) -> dict:
+        return value
+
+
+class SerializedSessionStore(InMemorySessionStore):
+    """Same eviction as InMemorySessionStore, but sessions are held as pickled bytes instead of live dicts."""
+
+    @staticmethod
+    def _dump(session: dict) -> bytes:
+        return pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value: bytes) -> dict:
+        return pickle.loads(value)
+
+
+# The store served by the manager process of a SharedSessionStore, set by _serve in that process.
+_served: Optional[SessionStore] = None
+
+
+def _serve(store: SessionStore):
+    global _served
+    _served = store
+
+
+class _StoreManager(BaseManager):
+    pass
+
+
+_StoreManager.register('store', callable=lambda: _served,
+                       exposed=('get', 'peek', 'put', 'discard', 'clear', '__len__', 'stats'))
+
+
+class SharedSessionStore(SessionStore):
+    """
+    Another store moved into a manager process, so processes forked afterwards share one set of sessions with
+    the eviction of that store, e.g. the workers of a BotServer. Every call is a round trip to the manager,
+    sessions are pickled on the way. shutdown stops the manager, its sessions go with it.
+    """
+
+    def __init__(self, store: SessionStore) -> None:
+        super().__init__()
+        self._manager = _StoreManager(ctx=multiprocessing.get_context('fork'))
+        # Forked, the manager process starts with the store as it is, nothing is pickled.
+        self._manager.start(_serve, (store,))
+        self._store = self._manager.store()
+
+    def get(self, session_id: Hashable) -> dict:
+        return self._store.get(session_id)
+
+    def peek(self, session_id: Hashable) -> dict:
+        return self._store.peek(session_id)
+
+    def put(self, session_id: Hashable, session: dict):
+        self._store.put(session_id, session)
+
+    def discard(self, session_id: Hashable):
+        self._store.discard(session_id)
+
+    def clear(self):
+        self._store.clear()
+
+    def __len__(self) -> int:
+        return self._store.__len__()
+
+    def stats(self) -> Dict[str, int]:
+        return self._store.stats()
+
+    def shutdown(self):
+        self._manager.shutdown()
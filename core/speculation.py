@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import copy
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Hashable, Optional, Tuple
+
+from core.logic import CoreBot, Response
+from core.text import Utterance
+
+module_logger = logging.getLogger(__name__)
+
+
+def normalise(text: str) -> str:
+    """Text as compared between hypotheses, lowercased with single spaces."""
+    return ' '.join(Utterance.of(text).lowered.split())
+
+
+class Speculator:
+    """
+    Answers an utterance while it is still being spoken. partial is fed the STT intermediate hypotheses; once one
+    stays the same for stable_polls polls in a row, CoreBot.respond runs on it in the background, on a copy of the
+    session, and output streams are told to prepare the response, e.g. synthesise its audio. When ask gets a final
+    text equal to the speculated one, in an unchanged session, that response and session are committed at once;
+    otherwise the bot answers as usual and the speculation was wasted.
+
+    Counters: speculations started, hits, misses (a final text without a matching speculation), wasted
+    (speculations whose result was never used) and wasted_seconds spent on them. With bot metrics, the time from
+    the final text to the committed response is observed as 'final_answer', labelled hit or miss, and a hit as
+    'ask' too, like the asks the bot answers itself.
+    """
+
+    def __init__(self, bot: CoreBot, session_id: Hashable = None, stable_polls: int = 2):
+        self.bot = bot
+        self.session_id = session_id
+        self.stable_polls = stable_polls
+        self.speculations = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+        self.wasted_seconds = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bot-speculation')
+        self._lock = threading.Lock()
+        self._hypothesis = ''
+        self._polls = 0
+        # Normalised text and the speculation on it, at most one per utterance is kept.
+        self._speculation: Optional[Tuple[str, Future]] = None
+
+    def partial(self, text: str):
+        """An intermediate hypothesis of the current utterance."""
+        text = normalise(text)
+        with self._lock:
+            self._polls = self._polls + 1 if text == self._hypothesis else 1
+            self._hypothesis = text
+            if not text or self._polls < self.stable_polls:
+                return
+            if self._speculation is not None:
+                if self._speculation[0] == text or not self._speculation[1].done():
+                    # Already speculated on, or busy with an older hypothesis which finishes first.
+                    return
+                self._discard(self._speculation[1])
+            self.speculations += 1
+            session = self._session()
+            self._speculation = text, self._executor.submit(self._speculate, text, session)
+
+    def ask(self, text: str) -> Optional[Response]:
+        """Answer the final text of the utterance, from the speculation when it matches."""
+        with self._lock:
+            speculation, self._speculation = self._speculation, None
+            self._hypothesis, self._polls = '', 0
+
+        started = time.perf_counter()
+        if speculation is not None and speculation[0] == normalise(text) and speculation[1].exception() is None:
+            started_from, session, response, _ = speculation[1].result()
+            if started_from == self._session():
+                self.hits += 1
+                module_logger.debug("Speculation hit: %s", text)
+                self.bot.commit(response, self.session_id, session)
+                if self.bot.metrics is not None:
+                    # Latency of the request as answered, comparable with the asks the bot answers itself.
+                    self.bot.metrics.observe('ask', 'CoreBot', time.perf_counter() - started)
+                self._observe('hit', started)
+                return response
+            # Another answer changed the session meanwhile.
+            self._discard(speculation[1])
+        elif speculation is not None:
+            self._discard(speculation[1])
+        self.misses += 1
+        response = self.bot.ask(text, session_id=self.session_id)
+        self._observe('miss', started)
+        return response
+
+    def stats(self) -> Dict[str, float]:
+        answered = self.hits + self.misses
+        return {'speculations': self.speculations, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / answered if answered else 0.0, 'wasted': self.wasted,
+                'wasted_seconds': self.wasted_seconds}
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _observe(self, outcome: str, started: float):
+        if self.bot.metrics is not None:
+            self.bot.metrics.observe('final_answer', outcome, time.perf_counter() - started)
+
+    def _session(self) -> dict:
+        """A copy of the conversation's session, peeked so store statistics and eviction order ignore speculation."""
+        if self.session_id is None:
+            return copy.deepcopy(self.bot.session)
+        return self.bot.session_store.peek(self.session_id)
+
+    def _speculate(self, text: str, started_from: dict) -> Tuple[dict, dict, Optional[Response], float]:
+        start = time.perf_counter()
+        session = copy.deepcopy(started_from)
+        response = self.bot.respond(text, session)
+        if response is not None:
+            for stream in self.bot.output_adapters:
+                stream.prepare(response)
+        return started_from, session, response, time.perf_counter() - start
+
+    def _discard(self, speculation: Future):
+        self.wasted += 1
+        speculation.add_done_callback(self._count_waste)
+
+    def _count_waste(self, speculation: Future):
+        if not speculation.cancelled() and speculation.exception() is None:
+            self.wasted_seconds += speculation.result()[3]
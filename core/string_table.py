@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import operator
+import os
+from array import array
+from typing import Iterable, Iterator
+
+import numpy as np
+
+
+class StringTable:
+    """
+    Append-only list of strings packed as UTF-8 into one buffer, with the offset of every string in another, so a
+    million strings cost their bytes plus eight per string instead of a Python object each. A string is decoded
+    only when it is read. Tables loaded with load keep the saved strings memory mapped and append to memory.
+    """
+
+    def __init__(self, strings: Iterable[str] = ()):
+        self._base_data = np.zeros(0, dtype=np.uint8)
+        self._base_offsets = np.zeros(1, dtype=np.int64)
+        self._data = bytearray()
+        self._offsets = array('q', [0])
+        self.extend(strings)
+
+    def __len__(self) -> int:
+        return len(self._base_offsets) - 1 + len(self._offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        idx = operator.index(idx)
+        base = len(self._base_offsets) - 1
+        if idx < 0:
+            idx += len(self)
+        if 0 <= idx < base:
+            return self._base_data[self._base_offsets[idx]:self._base_offsets[idx + 1]].tobytes().decode('utf-8')
+        if base <= idx < len(self):
+            idx -= base
+            return self._data[self._offsets[idx]:self._offsets[idx + 1]].decode('utf-8')
+        raise IndexError('string table index out of range')
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def extend(self, strings: Iterable[str]):
+        for string in strings:
+            # Bytes first, a reader never sees an offset past the end of the buffer.
+            self._data += string.encode('utf-8')
+            self._offsets.append(len(self._data))
+
+    def append(self, string: str):
+        self.extend([string])
+
+    @property
+    def nbytes(self) -> int:
+        return self._base_data.nbytes + self._base_offsets.nbytes + len(self._data) + self._offsets.itemsize * len(
+            self._offsets)
+
+    def save(self, directory: str, name: str):
+        """Write name_data.npy and name_offsets.npy into directory."""
+        tail = np.frombuffer(self._offsets, dtype=np.int64)[1:] + len(self._base_data)
+        np.save(os.path.join(directory, f'{name}_data.npy'),
+                np.concatenate([self._base_data, np.frombuffer(bytes(self._data), dtype=np.uint8)]))
+        np.save(os.path.join(directory, f'{name}_offsets.npy'), np.concatenate([self._base_offsets, tail]))
+
+    @classmethod
+    def load(cls, directory: str, name: str, mmap: bool = True) -> StringTable:
+        table = cls()
+        mode = 'r' if mmap else None
+        table._base_data = np.load(os.path.join(directory, f'{name}_data.npy'), mmap_mode=mode)
+        table._base_offsets = np.load(os.path.join(directory, f'{name}_offsets.npy'), mmap_mode=mode)
+        return table
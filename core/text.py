@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import sys
+import zipfile
+from functools import cached_property, lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+
+module_logger = logging.getLogger(__name__)
+
+# TfidfVectorizer's default token_pattern
+_TOKEN = re.compile(r'(?u)\b\w\w+\b')
+
+
+def __getattr__(name: str) -> Any:
+    # stop_words is resolved on first use, importing the module stays free of nltk and of the network.
+    if name == 'stop_words':
+        return list(_stop_words())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _nltk_data_paths() -> List[str]:
+    """The directories nltk.data.path searches by default."""
+    paths = [path for path in os.environ.get('NLTK_DATA', '').split(os.pathsep) if path]
+    paths.append(os.path.expanduser('~/nltk_data'))
+    if sys.platform.startswith('win'):
+        paths += [os.path.join(sys.prefix, 'nltk_data'), os.path.join(sys.prefix, 'share', 'nltk_data'),
+                  os.path.join(sys.prefix, 'lib', 'nltk_data'),
+                  os.path.join(os.environ.get('APPDATA', 'C:\\'), 'nltk_data'),
+                  r'C:\nltk_data', r'D:\nltk_data', r'E:\nltk_data']
+    else:
+        paths += [os.path.join(sys.prefix, 'nltk_data'), os.path.join(sys.prefix, 'share', 'nltk_data'),
+                  os.path.join(sys.prefix, 'lib', 'nltk_data'), '/usr/share/nltk_data', '/usr/local/share/nltk_data',
+                  '/usr/lib/nltk_data', '/usr/local/lib/nltk_data']
+    return paths
+
+
+def _read_local_stop_words() -> Optional[List[str]]:
+    for path in _nltk_data_paths():
+        corpus = os.path.join(path, 'corpora', 'stopwords', 'english')
+        if os.path.isfile(corpus):
+            with open(corpus, encoding='utf-8') as file:
+                return file.read().split()
+        archive = os.path.join(path, 'corpora', 'stopwords.zip')
+        if os.path.isfile(archive):
+            with zipfile.ZipFile(archive) as zipped:
+                return zipped.read('stopwords/english').decode('utf-8').split()
+    return None
+
+
+@lru_cache(maxsize=None)
+def _stop_words() -> Tuple[str, ...]:
+    """NLTK's English stop words, read straight from the local NLTK data and downloaded only when missing."""
+    words = _read_local_stop_words()
+    if words is None:
+        import nltk
+        module_logger.info("Downloading NLTK stopwords")
+        nltk.download('stopwords', quiet=True)
+        words = nltk.corpus.stopwords.words('english')
+    return tuple(words)
+
+
+@lru_cache(maxsize=None)
+def _stop_word_set() -> FrozenSet[str]:
+    return frozenset(_stop_words())
+
+
+def analyze(text: str) -> List[str]:
+    """Terms of a text as TfidfVectorizer(stop_words=stop_words) sees them: lowercased words without stop words."""
+    if isinstance(text, Utterance):
+        return list(text.terms)
+    stop_words = _stop_word_set()
+    return [term for term in _TOKEN.findall(text.lower()) if term not in stop_words]
+
+
+class Utterance(str):
+    """
+    Input text which remembers how it was analysed, so every analysis runs at most once per utterance however many
+    pre-processors and adapters need it. CoreBot passes one to all of them; being a str, code expecting the raw
+    text keeps working, and code that wants the analyses opts in through Utterance.of(input_text).
+    """
+
+    @classmethod
+    def of(cls, text: str) -> Utterance:
+        return text if isinstance(text, Utterance) else cls(text)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    # Pickled and copied as the plain text: the memo holds re.Match objects and index snapshots, which neither
+    # pickle nor should outlive the utterance, e.g. when an adapter keeps input_text in a session.
+    def __reduce__(self):
+        return str, (str(self),)
+
+    def __copy__(self) -> str:
+        return str(self)
+
+    def __deepcopy__(self, memo: dict) -> str:
+        return str(self)
+
+    @cached_property
+    def lowered(self) -> str:
+        return self.lower()
+
+    @cached_property
+    def tokens(self) -> Tuple[str, ...]:
+        from nltk.tokenize import casual_tokenize
+        return tuple(casual_tokenize(self))
+
+    @cached_property
+    def words(self) -> FrozenSet[str]:
+        """Lowercased whitespace separated words."""
+        return frozenset(self.lowered.split())
+
+    @cached_property
+    def terms(self) -> Tuple[str, ...]:
+        stop_words = _stop_word_set()
+        return tuple(term for term in _TOKEN.findall(self.lowered) if term not in stop_words)
+
+    @cached_property
+    def _memo(self) -> Dict[Hashable, Any]:
+        return {}
+
+    def matches(self, pattern: re.Pattern) -> List[re.Match]:
+        """Matches of the pattern, one scan per distinct pattern however many adapters share it."""
+        # Keyed by id, hashing a compiled pattern hashes its whole source.
+        return self.memo(id(pattern), lambda: list(pattern.finditer(self)))
+
+    def memo(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Result of compute, computed on the first call for this key, e.g. a query vector of some index."""
+        memo = self._memo
+        if key not in memo:
+            memo[key] = compute()
+        return memo[key]
+
+
+# Backreferences, named groups, conditionals and global inline flags change meaning or fail inside an alternation.
+_UNJOINABLE = re.compile(r'\\[1-9]|\(\?P|\(\?\(|\(\?<(?![=!])|^\(\?[aiLmsux]+\)')
+_SCOPED_FLAGS = ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'), (re.VERBOSE, 'x'))
+
+
+class PatternSet:
+    """
+    Patterns searched together first, as one alternation: when it finds nothing none of them matches, and
+    Utterance.matches of each is known without its own scan. Most utterances match no regex adapter at all. A
+    pattern that can't be joined, see _UNJOINABLE, or uses ASCII or LOCALE matching, still gets its own scan.
+    """
+
+    def __init__(self, patterns: Iterable[re.Pattern] = ()):
+        unique = {id(pattern): pattern for pattern in patterns}
+        self.patterns = [pattern for pattern in unique.values()
+                         if isinstance(pattern.pattern, str) and not pattern.flags & (re.ASCII | re.LOCALE)
+                         and not _UNJOINABLE.search(pattern.pattern)]
+        self.joined: Optional[re.Pattern] = None
+        if len(self.patterns) > 1:
+            try:
+                self.joined = re.compile('|'.join(map(_scoped, self.patterns)))
+            except re.error as error:
+                module_logger.warning("Regex patterns are scanned one by one, they can't be joined: %s", error)
+
+    def prime(self, utterance: Utterance):
+        if self.joined is not None and self.joined.search(utterance) is None:
+            for pattern in self.patterns:
+                utterance.memo(id(pattern), list)
+
+
+def _scoped(pattern: re.Pattern) -> str:
+    flags = ''.join(letter for flag, letter in _SCOPED_FLAGS if pattern.flags & flag)
+    # A comment at the end of a verbose pattern would swallow the closing parenthesis.
+    source = pattern.pattern + '\n' if pattern.flags & re.VERBOSE else pattern.pattern
+    return f'(?{flags}:{source})'
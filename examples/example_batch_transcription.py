@@ -0,0 +1,32 @@
+import argparse
+import logging
+
+from audio_porcessing.batch_transcription import BatchTranscriber, wav_paths
+from core.adapters import CorpusLogicAdapter, LowConfidenceAdapter
+from core.logic import CoreBot
+from examples.example_printer_assistant import ErrorCodeLogicAdapter, test_dialog
+
+logging.basicConfig(level=logging.INFO)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Transcribe recorded calls and replay them to the printer assistant')
+    parser.add_argument('directory', help='directory searched for .wav files')
+    parser.add_argument('--model', default='stt_temp/model.tflite')
+    parser.add_argument('--scorer', default='stt_temp/scorer.scorer')
+    parser.add_argument('--output', default='transcripts.jsonl')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    bot = CoreBot()
+    bot.add_logic_adapters(
+        [
+            CorpusLogicAdapter(test_dialog),
+            LowConfidenceAdapter(0.2, ["Sorry i dont understand.", "Could you repeat please?"]),
+            ErrorCodeLogicAdapter()
+        ]
+    )
+
+    transcriber = BatchTranscriber(args.model, args.scorer, processes=args.processes)
+    real_time_factor = transcriber.run(wav_paths(args.directory), args.output, bot)
+    print(f'{transcriber.audio_seconds:.1f}s of audio in {transcriber.wall_seconds:.1f}s, '
+          f'{1 / real_time_factor if real_time_factor else 0:.1f}x faster than real time')
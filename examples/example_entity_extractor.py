@@ -2,10 +2,9 @@ from __future__ import annotations
 
 import logging
 
-import nltk.tokenize
-
 from core.adapters import LowConfidenceAdapter
 from core.logic import CoreBot, Stream, Response, LogicAdapter, EntityExtractorAdapter
+from core.text import Utterance
 
 logging.basicConfig(level=logging.INFO)
 
@@ -17,6 +16,7 @@ class ConsoleStreamAdapter(Stream):
 
 
 class LovingAnimalAdapter(LogicAdapter):
+    max_confidence = 1
 
     def can_process(self, input_text, session: dict) -> bool:
         if 'animal' in session:
@@ -31,9 +31,10 @@ class LovingAnimalAdapter(LogicAdapter):
 
 
 class CityWeatherCheck(LogicAdapter):
+    max_confidence = 1
 
     def can_process(self, input_text, session: dict) -> bool:
-        if 'city' in session and 'weather' in nltk.tokenize.casual_tokenize(input_text):
+        if 'city' in session and 'weather' in Utterance.of(input_text).tokens:
             return True
 
     def __init__(self):
@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import logging
 import re
+from typing import List, Set
 
 from core.adapters import CorpusLogicAdapter, LowConfidenceAdapter
-from core.logic import Response, CoreBot, RegexLogicAdapter
+from core.logic import Response, CoreBot, RegexLogicAdapter, match_value
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -36,6 +37,7 @@ test_dialog = [
 class ErrorCodeLogicAdapter(RegexLogicAdapter):
     pattern = re.compile(r'#([\da-z]{2,})', flags=re.IGNORECASE)
     keywords = ['error', 'code', '#']
+    pure = True
 
     code_message = {
         '10': 'There is a problem on the duplex unit.',
@@ -49,13 +51,16 @@ class ErrorCodeLogicAdapter(RegexLogicAdapter):
     def __init__(self):
         super().__init__()
 
-    def process(self, input_text: str, session: dict) -> Response:
-        error_code = self.pattern.findall(input_text)[0].upper()
+    def process_matches(self, input_text: str, matches: List[re.Match], keywords: Set[str], session: dict) -> Response:
+        error_code = match_value(matches[0]).upper()
         if error_code in self.code_message:
             return Response(self.code_message[error_code], 1)
         else:
             return Response("Unknown error code", 0)
 
+    def static_responses(self) -> List[str]:
+        return list(dict.fromkeys(self.code_message.values())) + ["Unknown error code"]
+
 
 if __name__ == '__main__':
     bot = CoreBot()
@@ -0,0 +1,33 @@
+import argparse
+import logging
+
+from core.adapters import CorpusLogicAdapter, LowConfidenceAdapter
+from core.logic import CoreBot
+from core.server import BotServer
+from examples.example_printer_assistant import ErrorCodeLogicAdapter, test_dialog
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def printer_assistant(index: str = None) -> CoreBot:
+    corpus = CorpusLogicAdapter.load(index) if index else CorpusLogicAdapter(test_dialog)
+    bot = CoreBot()
+    bot.add_logic_adapters(
+        [
+            corpus,
+            LowConfidenceAdapter(0.2, ["Sorry i dont understand.", "Could you repeat please?"]),
+            ErrorCodeLogicAdapter()
+        ]
+    )
+    return bot
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the printer assistant to local clients')
+    parser.add_argument('--socket', default='/tmp/hal-bot.sock')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, one per core by default')
+    parser.add_argument('--index', help='corpus directory written by CorpusLogicAdapter.save, memory mapped')
+    args = parser.parse_args()
+
+    # Try it with: echo '{"text": "error #10"}' | nc -U /tmp/hal-bot.sock
+    BotServer(lambda: printer_assistant(args.index), args.socket, args.workers).serve_forever()
@@ -45,10 +45,13 @@ if __name__ == '__main__':
         BinaryConvertRegexLogicAdapter()
     ])
 
+    tts = CoquiTTSStreamAdapter()
+    tts.pre_synthesise(bot.static_responses(), background=True)
+
     bot.add_output_adapters([
         ConsoleStreamAdapter(),
         ExampleApiStreamAdapter(),
-        CoquiTTSStreamAdapter(),
+        tts,
         # TtsStreamAdapter(),
     ])
 
@@ -0,0 +1,81 @@
+import asyncio
+import re
+import unittest
+
+from core.adapters import BinaryConvertRegexLogicAdapter, CorpusLogicAdapter, LowConfidenceAdapter
+from core.async_bot import AsyncCoreBot
+from core.logic import CoreBot, LogicAdapter, RegexLogicAdapter, Response
+
+
+class KeywordAdapter(LogicAdapter):
+    """Answers inputs with its keyword at a fixed confidence, as a coroutine if asynchronous."""
+
+    def __init__(self, keyword: str, confidence: float, cost: float, max_confidence: float = float('inf')) -> None:
+        self.keyword = keyword
+        self.confidence = confidence
+        self.cost = cost
+        self.max_confidence = max_confidence
+
+    def can_process(self, input_text, session: dict) -> bool:
+        return self.keyword in input_text.lower()
+
+    def process(self, input_text: str, session: dict) -> Response:
+        session.setdefault('answered', []).append(self.keyword)
+        return Response(f'{self.keyword} at {self.confidence}', self.confidence)
+
+
+class AsyncKeywordAdapter(KeywordAdapter):
+
+    async def process(self, input_text: str, session: dict) -> Response:
+        await asyncio.sleep(0.001)
+        return super().process(input_text, session)
+
+
+class QuestionAdapter(RegexLogicAdapter):
+    pattern = re.compile(r'\?$')
+    keywords = ['what', 'why']
+
+    def process_matches(self, input_text, matches, keywords, session) -> Response:
+        return Response('Good question', self.calculate_confidence('?', input_text, keywords))
+
+
+def adapters(asynchronous: bool):
+    """A mixed set, its time adapter a coroutine for AsyncCoreBot, CoreBot can only call synchronous adapters."""
+    return [
+        CorpusLogicAdapter([('what is the weather', 'Sunny'), ('who are you', 'A bot'), ('what time is it', 'Noon')]),
+        KeywordAdapter('weather', 0.9, cost=0.5, max_confidence=0.9),
+        (AsyncKeywordAdapter if asynchronous else KeywordAdapter)('time', 0.9, cost=2.0),
+        KeywordAdapter('bot', 1.0, cost=20.0),
+        QuestionAdapter(),
+        BinaryConvertRegexLogicAdapter(),
+        LowConfidenceAdapter(0.2, 'Sorry?'),
+    ]
+
+
+INPUTS = ['what is the weather', 'What time is it?', 'who are you', 'are you a bot', 'binary 1011', 'why?',
+          'hello there', 'weather bot time?']
+
+
+class ParityTest(unittest.TestCase):
+
+    def test_ask_async_answers_as_ask(self):
+        for early_exit in (True, False):
+            bot = CoreBot(early_exit=early_exit)
+            bot.add_logic_adapters(adapters(asynchronous=False))
+            expected = [bot.ask(text) for text in INPUTS]
+
+            async def ask_all():
+                async_bot = AsyncCoreBot(early_exit=early_exit)
+                async_bot.add_logic_adapters(adapters(asynchronous=True))
+                try:
+                    return [await async_bot.ask_async(text) for text in INPUTS]
+                finally:
+                    await async_bot.aclose()
+
+            found = asyncio.run(ask_all())
+            self.assertEqual([(response.response_text, response.confidence) for response in found],
+                             [(response.response_text, response.confidence) for response in expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
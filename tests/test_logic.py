@@ -0,0 +1,85 @@
+import re
+import threading
+import time
+import unittest
+
+from core.adapters import LowConfidenceAdapter
+from core.logic import CoreBot, LogicAdapter, RegexLogicAdapter, Response
+
+
+class StatefulAdapter(LogicAdapter):
+    """Answers after a delay and counts in the session how many times it answered."""
+
+    def __init__(self, seconds: float, confidence: float) -> None:
+        self.seconds = seconds
+        self.confidence = confidence
+        self.returned = threading.Event()
+
+    def can_process(self, input_text, session: dict) -> bool:
+        return True
+
+    def process(self, input_text: str, session: dict) -> Response:
+        time.sleep(self.seconds)
+        session['answers'] = session.get('answers', 0) + 1
+        session.pop('stale', None)
+        self.returned.set()
+        return Response(f'Answer {session["answers"]}', self.confidence)
+
+
+class FallbackAdapter(LogicAdapter):
+    fallback = True
+
+    def can_process(self, input_text, session: dict) -> bool:
+        return True
+
+    def process(self, input_text: str, session: dict) -> Response:
+        session['fallback'] = True
+        return Response('Sorry?', 0.1)
+
+
+class DeadlineSessionTest(unittest.TestCase):
+
+    def test_writes_of_adapter_in_time_persist(self):
+        bot = CoreBot()
+        bot.add_logic_adapters([StatefulAdapter(0.05, 0.9), FallbackAdapter()])
+        bot.session_store.put('user', {'stale': True})
+
+        first = bot.ask('hello', session_id='user', deadline_ms=2000)
+        second = bot.ask('hello', session_id='user', deadline_ms=2000)
+
+        self.assertEqual((first.response_text, second.response_text), ('Answer 1', 'Answer 2'))
+        self.assertEqual(bot.session_store.get('user'), {'answers': 2, 'fallback': True})
+
+    def test_writes_of_adapter_timed_out_are_dropped(self):
+        bot = CoreBot()
+        slow = StatefulAdapter(0.3, 0.9)
+        bot.add_logic_adapters([slow, FallbackAdapter()])
+
+        response = bot.ask('hello', session_id='user', deadline_ms=50)
+        self.assertTrue(slow.returned.wait(5))
+
+        self.assertEqual(response.response_text, 'Sorry?')
+        self.assertEqual(bot.session_store.get('user'), {'fallback': True})
+
+
+class EmphaticAdapter(RegexLogicAdapter):
+    """Confident beyond 1.0, as a subclass computing its own confidence may be."""
+    pattern = re.compile(r'!+')
+    keywords = []
+
+    def process_matches(self, input_text, matches, keywords, session) -> Response:
+        return Response('Calm down', 1.5)
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def test_regex_adapter_above_one_is_not_skipped(self):
+        bot = CoreBot()
+        bot.add_logic_adapters([EmphaticAdapter(), LowConfidenceAdapter(1.0, 'Sure')])
+
+        self.assertEqual(bot.ask('Now!!').response_text, 'Calm down')
+        self.assertEqual(bot.skipped_adapter_calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from audio_porcessing import pre_synthesis
+from audio_porcessing.audio_cache import AudioCache
+from audio_porcessing.pre_synthesis import PreSynthesis
+from core.adapters import CorpusLogicAdapter, LowConfidenceAdapter
+from core.logic import CoreBot
+
+
+class FixedSizeModel:
+    """Writes 1000 bytes per text and records the texts it was asked for."""
+
+    def __init__(self) -> None:
+        self.texts = []
+
+    def tts_to_file(self, text: str, file_path: str):
+        self.texts.append(text)
+        with open(file_path, 'wb') as file:
+            file.write(b'\0' * 1000)
+
+
+class BudgetTest(unittest.TestCase):
+
+    def test_stops_submitting_at_max_disk_bytes(self):
+        cache = AudioCache(tempfile.mkdtemp(), max_disk_bytes=4500, max_memory_bytes=0)
+        model = FixedSizeModel()
+        items = [(f'text {idx}', f'key{idx}') for idx in range(10)]
+        synthesis = PreSynthesis(items, 'model', cache, processes=1, progress=lambda *_: None)
+
+        with mock.patch.object(pre_synthesis, '_tts', model), mock.patch.object(pre_synthesis, '_cache', cache), \
+                ThreadPoolExecutor(1) as pool, self.assertLogs(pre_synthesis.module_logger, 'WARNING'):
+            synthesis._synthesise_within_budget(pool)
+
+        self.assertEqual(model.texts, ['text 0', 'text 1', 'text 2', 'text 3'])
+        self.assertEqual((synthesis.done, synthesis.skipped, synthesis.disk_bytes), (4, 6, 4000))
+
+    def test_fallback_responses_come_first(self):
+        bot = CoreBot()
+        corpus = CorpusLogicAdapter([('Hi', 'Hello'), ('Hey', 'Hi')])
+        bot.add_logic_adapters([corpus, LowConfidenceAdapter(0.2, 'Sorry?')])
+
+        self.assertEqual(bot.static_responses(), ['Sorry?', 'Hello', 'Hi'])
+
+
+if __name__ == '__main__':
+    unittest.main()
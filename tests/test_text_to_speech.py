@@ -0,0 +1,47 @@
+import tempfile
+import threading
+import time
+import unittest
+import wave
+from unittest import mock
+
+from audio_porcessing.text_to_speech import CoquiTTSStreamAdapter
+from core.logic import Response
+
+
+class SlowModel:
+    """Writes a short silent WAV after a delay and records the texts it was asked for."""
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self.texts = []
+        self.started = threading.Event()
+
+    def tts_to_file(self, text: str, file_path: str):
+        self.texts.append(text)
+        self.started.set()
+        time.sleep(self.seconds)
+        with wave.open(file_path, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes(b'\0\0' * 1600)
+
+
+class PrepareThenHandleTest(unittest.TestCase):
+
+    def test_handle_waits_for_prepare_of_same_text(self):
+        adapter = CoquiTTSStreamAdapter(tempfile.mkdtemp(), model_loading='lazy')
+        adapter._tts = model = SlowModel(0.3)
+        response = Response('Hello there friend.', 0.9)
+
+        with mock.patch('audio_porcessing.text_to_speech.play'):
+            adapter.prepare(response)
+            self.assertTrue(model.started.wait(5))
+            adapter.handle(response)
+
+        self.assertEqual(model.texts, ['Hello there friend.'])
+
+
+if __name__ == '__main__':
+    unittest.main()